@@ -1,17 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from typing import Optional, List
 from sqlalchemy.orm import Session
 from datetime import datetime
 
 from app.api.deps import get_current_user
 from app.core.config import settings
-from app.db.database import get_db
+from app.db.database import get_db, SessionLocal
 from app.models.user import User
 from app.models.chats import QuerySearch, Chat, ChatMessage
-from app.schemas.chats import QueryBase, QueryInDB, QueryDelete, MessageBase, MessageInDB, SendMessage, OpenChat    
-from app.helpers.llm import TITLE_GENERATOR, ANSWER_CREATOR
+from app.schemas.chats import QueryBase, QueryInDB, QueryDelete, MessageBase, MessageInDB, SendMessage, OpenChat, BatchSearch
+from app.helpers.llm import ANSWER_CREATOR, asearch, title_or_fallback
+from app.helpers.weaviate import query_cache
+from app.helpers.reranker import RERANKER
+from app.helpers.answer_cache import ANSWER_CACHE
+from app.helpers.llm_pool import LLM_POOL
+from app.helpers.chat_summary import as_history, recent_messages, update_chat_summary
 
+import asyncio
 import base64
+import json
 import os
 from dotenv import load_dotenv
 from cryptography.fernet import Fernet
@@ -21,6 +30,79 @@ ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
 
 router = APIRouter()
 
+def decrypt_api_key(eapi):
+    if not eapi:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="API key is required")
+    if not ENCRYPTION_KEY:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Encryption key not configured")
+    try:
+        cipher = Fernet(ENCRYPTION_KEY.encode())
+        return cipher.decrypt(base64.urlsafe_b64decode(eapi)).decode('utf-8')
+    except Exception as e:
+        print(f"Error decrypting API key: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to decrypt API key")
+
+def save_search(db, user_id, query, title, answer):
+    """Store a new search with its chat and the first question/answer pair."""
+    search = QuerySearch(
+        query = query,
+        title = title,
+        user_id = user_id,
+    )
+    db.add(search)
+    db.flush()
+
+    chat = Chat(
+        parent_query_id = search.query_id
+    )
+    db.add(chat)
+    db.flush()
+    search.chat_id = chat.chat_id
+    save_exchange(db, chat.chat_id, query, answer)
+    db.refresh(search)
+    return search
+
+def save_exchange(db, chat_id, query, answer):
+    human_message = ChatMessage(
+        parent_chat_id = chat_id,
+        role = "HUMAN",
+        content = query
+    )
+    ai_response = ChatMessage(
+        parent_chat_id = chat_id,
+        role = "MACHINE",
+        content = answer
+    )
+    db.add(human_message)
+    db.add(ai_response)
+    db.commit()
+
+def with_session(function, *args):
+    """Call `function(db, *args)` on a session of its own, for writes that outlive the request's session."""
+    db = SessionLocal()
+    try:
+        return function(db, *args)
+    finally:
+        db.close()
+
+def load_chat(db, chat_id, user_id):
+    """The chat and its recent messages as prompt history, once it is known to belong to `user_id`."""
+    chat_item = db.query(Chat).filter(Chat.chat_id == chat_id).first()
+    if not chat_item:
+        raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail = "Chat not found")
+    query_item = db.query(QuerySearch).filter(QuerySearch.query_id == chat_item.parent_query_id).first()
+    if query_item.user_id != user_id:
+        raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail = "You are not authorized to ask this query")
+    return chat_item, as_history(recent_messages(db, chat_item.chat_id))
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def event_stream(events, background = None):
+    # X-Accel-Buffering stops nginx-style proxies from holding tokens back
+    return StreamingResponse(events, media_type = "text/event-stream", headers = {"Cache-Control":"no-cache", "X-Accel-Buffering":"no"},
+                             background = background)
+
 @router.get('/all-searches')
 def get_all_searches(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     try:
@@ -39,77 +121,32 @@ def get_all_searches(db: Session = Depends(get_db), current_user: User = Depends
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error in fetching your data: {e}")
     
+@router.get('/cache-stats')
+def cache_stats(current_user: User = Depends(get_current_user)):
+    return {
+        "error":False,
+        "query_embeddings":query_cache.stats(),
+        "reranker":RERANKER.stats() if RERANKER is not None else None,
+        "answers":ANSWER_CACHE.stats() if ANSWER_CACHE is not None else None,
+        "llm_clients":LLM_POOL.stats()
+    }
+    
 @router.post('/search')
-def search(query: QueryBase, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def search(query: QueryBase, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     try:
         user_id = current_user.user_id
-        eapi = current_user.api_key
-        
-        print(eapi)
-        # Validate API key
-        if not eapi:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="API key is required")
-        
-        # Decrypt the API key
-        try:
-            if not ENCRYPTION_KEY:
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Encryption key not configured")
-            
-            cipher = Fernet(ENCRYPTION_KEY.encode())
-            
-            encrypted_key = base64.urlsafe_b64decode(eapi)
-            decrypted = cipher.decrypt(encrypted_key).decode('utf-8')
-            api_key = decrypted
-            print("API Key Decrypted successfully")
-                
-        except Exception as e:
-            print(f"Error decrypting API key: {e}")
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to decrypt API key")
-        
-        query = query.query
-        title = TITLE_GENERATOR.title(query, api_key=api_key)
-        response = ANSWER_CREATOR.generate(query, api_key=api_key)
+        api_key = decrypt_api_key(current_user.api_key)
 
-        if title['error']:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=title['message'])
+        certainty = query.certainty
+        filters = query.filters.model_dump() if query.filters else None
+        query = query.query
+        response = await asearch(query, api_key=api_key, certainty=certainty, filters=filters)
 
         if response['error']:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=response['message'])
         else:
-           search = QuerySearch(
-            query = query,
-            title = title['title'],
-            user_id = user_id,
-           )
-
-           db.add(search)
-           db.flush()
-
-           chat =  Chat(
-            parent_query_id = search.query_id
-           )   
-           db.add(chat)
-           db.flush()
-           search.chat_id = chat.chat_id
-
-           human_message = ChatMessage(
-            parent_chat_id = chat.chat_id,
-            role = "HUMAN",
-            content = query
-           )
-
-           machine_response = ChatMessage(
-            parent_chat_id = chat.chat_id,
-            role = "MACHINE",
-            content = response['message']
-           )
-           db.add(human_message)
-           db.add(machine_response)
-           db.commit()
-           db.refresh(search)
-           db.refresh(chat)
-           db.refresh(human_message)
-           db.refresh(machine_response)
+           # Session work is blocking, so it runs off the event loop
+           search = await asyncio.to_thread(save_search, db, user_id, query, response['title'], response['message'])
 
            message = {
             "error":False,
@@ -121,6 +158,54 @@ def search(query: QueryBase, db: Session = Depends(get_db), current_user: User =
         print(e)
         raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, detail = f"Error in searching: {e}")
 
+@router.post('/batch-search')
+async def batch_search(batch: BatchSearch, current_user: User = Depends(get_current_user)):
+    """Retrieval (and optionally answers) for many queries in one request. Nothing is saved as a chat."""
+    if not batch.queries:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail = "No queries given")
+    if len(batch.queries) > settings.BATCH_SEARCH_MAX_QUERIES:
+        raise HTTPException(status_code = status.HTTP_400_BAD_REQUEST, detail = f"At most {settings.BATCH_SEARCH_MAX_QUERIES} queries per request")
+    # The key is only needed, and decrypted once, when answers are requested
+    api_key = decrypt_api_key(current_user.api_key) if batch.answer else None
+    response = await ANSWER_CREATOR.abatch(
+        batch.queries,
+        api_key = api_key,
+        certainty = batch.certainty,
+        filters = batch.filters.model_dump() if batch.filters else None,
+        answer = batch.answer
+    )
+    if response['error']:
+        raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, detail = response['message'])
+    return response
+
+@router.post('/search/stream')
+async def search_stream(query: QueryBase, current_user: User = Depends(get_current_user)):
+    """Streaming /search: "token" events as the answer is generated, then "done" with the query_id once it is saved."""
+    api_key = decrypt_api_key(current_user.api_key)
+    user_id = current_user.user_id
+    certainty = query.certainty
+    filters = query.filters.model_dump() if query.filters else None
+    query = query.query
+
+    async def events():
+        title_task = asyncio.create_task(title_or_fallback(query, api_key=api_key))
+        pieces = []
+        try:
+            async for piece in ANSWER_CREATOR.astream(query, api_key=api_key, certainty=certainty, filters=filters):
+                pieces.append(piece)
+                yield sse("token", {"token":piece})
+            title = await title_task
+            # The request's session is closed by the time the body streams, so the rows get their own
+            search = await asyncio.to_thread(with_session, save_search, user_id, query, title, "".join(pieces))
+            yield sse("done", {"query_id":search.query_id, "title":title})
+        except Exception as e:
+            print(e)
+            yield sse("error", {"message":f"Error in searching: {e}"})
+        finally:
+            title_task.cancel()
+
+    return event_stream(events())
+
 @router.get("/open_chat")
 def open_chat(query_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     try:
@@ -149,84 +234,62 @@ def open_chat(query_id: int, db: Session = Depends(get_db), current_user: User =
         raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, detail = f"Error in opening chat: {e}")
 
 @router.post("/ask")
-def ask(message: SendMessage, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def ask(message: SendMessage, background_tasks: BackgroundTasks, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     try:
         chat_id = message.chat_id
         query = message.query
         user_id = current_user.user_id
-        eapi = current_user.api_key
-        
-        print(eapi)
-        # Validate API key
-        if not eapi:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="API key is required")
-        
-        # Decrypt the API key
-        try:
-            if not ENCRYPTION_KEY:
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Encryption key not configured")
-            
-            cipher = Fernet(ENCRYPTION_KEY.encode())
-            
-            encrypted_key = base64.urlsafe_b64decode(eapi)
-            decrypted = cipher.decrypt(encrypted_key).decode('utf-8')
-            api_key = decrypted
-            print("API Key Decrypted successfully")
-                
-        except Exception as e:
-            print(f"Error decrypting API key: {e}")
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to decrypt API key")
-        
-        chat_item = db.query(Chat).filter(Chat.chat_id == chat_id).first()
-        parent_query_id = chat_item.parent_query_id
-        user_id = current_user.user_id
-        query_item = db.query(QuerySearch).filter(QuerySearch.query_id == parent_query_id).first()
-        print("User ID:" + str(user_id))
-        print("Query Owner: " + str(query_item.user_id))
-        if query_item.user_id != user_id:
-            raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail = "You are not authorized to ask this query")
-        
-        if not chat_item:
-            raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail = "Chat not found")
+        api_key = decrypt_api_key(current_user.api_key)
+
+        # Session work is blocking, so it runs off the event loop
+        chat_item, message_history = await asyncio.to_thread(load_chat, db, chat_id, user_id)
+        summary = chat_item.summary
+        chat_id = chat_item.chat_id
+        answer = await ANSWER_CREATOR.acontinuous_response(query, message_history, threshold=settings.CHAT_RECENT_MESSAGES,
+                                                                api_key=api_key, certainty=message.certainty,
+                                                                filters=message.filters.model_dump() if message.filters else None,
+                                                                summary=summary)
+        if answer['error']:
+            raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, detail = answer['message'])
         else:
-            message_history = []
-            messages = db.query(ChatMessage).filter(ChatMessage.parent_chat_id == chat_item.chat_id).order_by(ChatMessage.sent.asc())
-            for chat_message in messages:
-                message_history.append(
-                    {
-                        "role":chat_message.role,
-                        "content":chat_message.content
-                    }
-                )
-            answer = ANSWER_CREATOR.continuous_response(query, message_history, api_key=api_key)
-            if answer['error']:
-                raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, detail = answer['message'])
-            else:
-                response = answer['message']
-                human_message = ChatMessage(
-                    parent_chat_id = chat_item.chat_id,
-                    role = "HUMAN",
-                    content = query
-                )
-                ai_response = ChatMessage(
-                    parent_chat_id = chat_item.chat_id,
-                    role = "MACHINE",
-                    content = response
-                )
-                db.add(human_message)
-                db.add(ai_response)
-                db.commit()
-                db.refresh(human_message)
-                db.refresh(ai_response)
-                message = {
-                    "error":False,
-                    "message":response,
-                    "chat_id":chat_id
-                }
-                return message
+            response = answer['message']
+            await asyncio.to_thread(save_exchange, db, chat_id, query, response)
+            background_tasks.add_task(update_chat_summary, chat_id, api_key)
+            message = {
+                "error":False,
+                "message":response,
+                "chat_id":chat_id
+            }
+            return message
     except Exception as e:
         raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, detail = f"Error in asking: {e}")
 
+@router.post("/ask/stream")
+async def ask_stream(message: SendMessage, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Streaming /ask: "token" events as the answer is generated, then "done" once the exchange is saved."""
+    api_key = decrypt_api_key(current_user.api_key)
+    chat_item, message_history = await asyncio.to_thread(load_chat, db, message.chat_id, current_user.user_id)
+    summary = chat_item.summary
+    chat_id = chat_item.chat_id
+    query = message.query
+    filters = message.filters.model_dump() if message.filters else None
+
+    async def events():
+        pieces = []
+        try:
+            async for piece in ANSWER_CREATOR.astream(query, api_key=api_key, certainty=message.certainty, filters=filters,
+                                                      message_history=message_history, threshold=settings.CHAT_RECENT_MESSAGES,
+                                                      summary=summary):
+                pieces.append(piece)
+                yield sse("token", {"token":piece})
+            await asyncio.to_thread(with_session, save_exchange, chat_id, query, "".join(pieces))
+            yield sse("done", {"chat_id":chat_id})
+        except Exception as e:
+            print(e)
+            yield sse("error", {"message":f"Error in asking: {e}"})
+
+    return event_stream(events(), background = BackgroundTask(update_chat_summary, chat_id, api_key))
+
 @router.delete("/delete_chat")
 def delete_chat(query: QueryBase, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     try:
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
-from typing import List
-from fastapi import BackgroundTasks
+from typing import List, Optional
 import asyncio
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 from pathlib import Path
 
@@ -10,70 +10,90 @@ from app.api.deps import get_current_user
 from app.core.config import settings
 import boto3
 from app.db.database import get_db
-from app.models.document import Document, AuthorConnection
-from app.schemas.document import DocumentCreate, Document as DocSchema, DocumentUpdate, ConnectionCreate, AuthorConnection as ConnSchema, ConnectionUpdate, DocumentDelete
+from app.models.document import Document, AuthorConnection, IngestJob
+from app.schemas.document import DocumentCreate, Document as DocSchema, DocumentUpdate, ConnectionCreate, AuthorConnection as ConnSchema, ConnectionUpdate, DocumentDelete, UploadResponse, IngestJob as JobSchema, IngestStatus
 from app.schemas.user import User as UserSchema
 from app.models.user import User
 from botocore.exceptions import ClientError, NoCredentialsError
 import uuid
+import hashlib
+import shutil
 import os
-import tempfile
 import json
-from app.helpers.weaviate import WeaviateDB, PDFLoader
+from app.helpers.weaviate import PDFLoader, embedding_cache
+from app.helpers.vectorstore import get_vector_store
+from app.helpers.ingest import IngestPipeline, extract_archive, file_sha256
+from app.helpers.spool import spool_bytes, spool_file, remove_spooled
+from app.helpers.corpus_version import bump_shared_corpus_version
 
 router = APIRouter()
 
-weaviate_host = settings.WEAVIATE_URL
-weaviate_client = WeaviateDB(weaviate_host)
+vector_store = get_vector_store()
 loader = PDFLoader()
 
 try:
-   weaviate_client.ensure_schema()
+   vector_store.ensure_schema()
 except Exception as e:
    pass
 
-def chunk_and_upload(temp_file_path: str,file_name: str, authors_list: List[str], file_link: str, doc_id: int):
-   db = next(get_db())
-   try:
-      if not os.path.exists(temp_file_path):
-         raise Exception(f"Temporary file not found: {temp_file_path}")
-      
-      import time
-      start_time = time.time()      
-      chunk_start = time.time()
-      documents = loader.load(temp_file_path, file_name, authors_list, file_link)
-      chunk_time = time.time() - chunk_start
-      print(f"Document chunking completed in {chunk_time:.2f}s, {len(documents)} chunks created")
-      
-      # Upload to Weaviate
-      weaviate_start = time.time()
-      weaviate_client.upload_file(documents)
-      weaviate_time = time.time() - weaviate_start
-      print(f"Weaviate upload completed in {weaviate_time:.2f}s")
-      
-      doc = db.query(Document).filter(Document.document_id == doc_id).first()
-      if doc:
-         db.commit()
-      total_time = time.time() - start_time
-      print(f"Total processing time: {total_time:.2f}s")
-      
-   except Exception as e:
-      doc = db.query(Document).filter(Document.document_id == doc_id).first()
-      if doc:
-         db.delete(doc)
-      db.commit()
-      raise Exception(f"Error in Chunking and Uploading file: {e}")
-   finally:
-       db.close()
-       if temp_file_path and os.path.exists(temp_file_path):
-         try:
-            os.remove(temp_file_path)
-            print(f"Temporary file deleted: {temp_file_path}")
-         except Exception as cleanup_error:
-            print(f"Warning: Could not delete temporary file: {cleanup_error}")
-
-@router.post('/upload', response_model = DocSchema)
-async def upload_document(background_tasks: BackgroundTasks, document_data: str =  Form(...), authors: str = Form(...), file: UploadFile = File(...),
+def ingest_file(file_path: str, file_name: str, authors_list: List[str], file_link: str, metadata: Optional[dict] = None):
+   """Parse, embed and upload one PDF to the vector store. Raises on failure so the caller can retry.
+
+   `metadata` ({"document_id", "subject"}) is stored on every chunk for filtered retrieval.
+   """
+   if not os.path.exists(file_path):
+      raise Exception(f"Ingest file not found: {file_path}")
+
+   # Parsing, embedding and vector-store writes overlap, page by page
+   pages = loader.iter_pages(file_path, file_name, authors_list, file_link, metadata)
+   stats = IngestPipeline(vector_store).run(pages)
+   print(f"Document chunking took {stats['parse']['seconds']:.2f}s, {stats['chunks']} chunks created")
+   print(f"Embedding took {stats['embed']['seconds']:.2f}s ({stats['embed']['chunks_per_second']} chunks/sec)")
+   print(f"Vector store upload took {stats['write']['seconds']:.2f}s")
+   if embedding_cache is not None:
+      print(f"Embedding cache: {embedding_cache.stats()}")
+   print(f"Total processing time: {stats['total_seconds']:.2f}s")
+   return stats
+
+def queue_document(db: Session, doc_data: DocumentCreate, authors_data: List[ConnectionCreate], uploader_id: str, spool_path: str, content_hash: str):
+   """Add the Document, its authors and a queued IngestJob to the session without committing."""
+   doc = Document(
+      document_name = doc_data.document_name,
+      document_link = doc_data.document_link,
+      uploaded_by = uploader_id,
+      subject = doc_data.subject,
+      content_hash = content_hash
+   )
+   db.add(doc)
+   db.flush()
+
+   for author in authors_data:
+      connection = AuthorConnection(
+         authorname = author.authorname,
+         authoremail = "" if not author.authoremail else author.authoremail,
+         document_conn = doc.document_id,
+         primary_author = False if not author.primary_author else author.primary_author
+      )
+      db.add(connection)
+
+   job = IngestJob(
+      document_id = doc.document_id,
+      file_path = spool_path,
+      document_name = doc_data.document_name,
+      authors = json.dumps([author.authorname for author in authors_data]),
+      document_link = doc_data.document_link,
+      status = "queued",
+      max_attempts = settings.INGEST_MAX_ATTEMPTS
+   )
+   db.add(job)
+   db.flush()
+   return doc, job
+
+def duplicate_conflict(duplicate: Document):
+   return HTTPException(status_code = status.HTTP_409_CONFLICT, detail = f"This PDF has already been uploaded as '{duplicate.document_name}' (doc_id {duplicate.document_id})")
+
+@router.post('/upload', response_model = UploadResponse)
+async def upload_document(document_data: str =  Form(...), authors: str = Form(...), file: UploadFile = File(...),
                      db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     
     try:
@@ -88,9 +108,21 @@ async def upload_document(background_tasks: BackgroundTasks, document_data: str
       allowed_type = set(["application/pdf"])
       if file.content_type not in allowed_type:
          raise Exception(f"Unsupoported File Type")
-      file_content = await file.read()
-      if len(file_content) > 5 * 1024 * 1024:
-         raise Exception("Too large of a file. (Max Upload: 5MB)")
+      # Hash the upload while it is read so identical PDFs are caught before any parsing
+      hasher = hashlib.sha256()
+      parts = []
+      size = 0
+      while True:
+         part = await file.read(1024 * 1024)
+         if not part:
+            break
+         size += len(part)
+         if size > 5 * 1024 * 1024:
+            raise Exception("Too large of a file. (Max Upload: 5MB)")
+         hasher.update(part)
+         parts.append(part)
+      file_content = b"".join(parts)
+      content_hash = hasher.hexdigest()
     except Exception as e:
       raise HTTPException(status_code = status.HTTP_406_NOT_ACCEPTABLE, detail = "Not Acceptable PDF file format")
    
@@ -98,49 +130,135 @@ async def upload_document(background_tasks: BackgroundTasks, document_data: str
     document = db.query(Document).filter(Document.document_name == doc_name).first()
     if document:
         raise HTTPException(status_code = status.HTTP_409_CONFLICT, detail="Document already exists in Database")
+
+    duplicate = db.query(Document).filter(Document.content_hash == content_hash).first()
+    if duplicate:
+        raise duplicate_conflict(duplicate)
     
     
     else:
+      spool_path = None
       try:
         uploader_id = current_user.user_id
-        author_list = []
-        for author in authors_data:
-            author_list.append(author.authorname)
-        temp_filename = f"{uuid.uuid4()}.pdf"
-        temp_path = os.path.join(tempfile.gettempdir(), temp_filename)
-        with open(temp_path, "wb") as f:
-            f.write(file_content)
-         
-        #await chunk_and_upload(file, doc_name, author_list, doc_data.document_link)
-        doc = Document(
-            document_name = doc_name,
-            document_link = doc_data.document_link,
-            uploaded_by = uploader_id,
-            subject = doc_data.subject
-        )
-        db.add(doc)
-        db.flush()
-
-        for author in authors_data:
-            connection = AuthorConnection(
-                authorname = author.authorname,
-                authoremail = "" if not author.authoremail else author.authoremail,
-                document_conn = doc.document_id,
-                primary_author = False if not author.primary_author else author.primary_author
-            )
-            db.add(connection)
-        
+        # Spool the upload somewhere every worker can reach and that survives a restart; the ingest worker deletes it when done
+        spool_path = await asyncio.to_thread(spool_bytes, file_content)
+
+        doc, job = queue_document(db, doc_data, authors_data, uploader_id, spool_path, content_hash)
         db.commit()
         db.refresh(doc)
+        db.refresh(job)
 
-        author_list = [author.authorname for author in authors_data]
-        background_tasks.add_task(chunk_and_upload, temp_path, doc_name, author_list, doc_data.document_link, doc.document_id)
-        return doc
+        response = UploadResponse.model_validate(doc)
+        response.job_id = job.job_id
+        return response
+      except IntegrityError as e:
+         # A concurrent upload of the same PDF committed between the check above and ours
+         db.rollback()
+         await asyncio.to_thread(remove_spooled, spool_path)
+         duplicate = db.query(Document).filter(Document.content_hash == content_hash).first()
+         if duplicate:
+            raise duplicate_conflict(duplicate)
+         print(e)
+         raise HTTPException(status_code = status.HTTP_409_CONFLICT, detail = "Document already exists in Database")
       except Exception as e:
          db.rollback()
+         await asyncio.to_thread(remove_spooled, spool_path)
          print(e)
          raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail = "Error occured in uploading document!")
 
+def queue_bulk(db: Session, documents: list, extracted: dict, user_id: str):
+    """Spool and queue the extracted PDFs of a bulk upload; returns the queued and skipped entries."""
+    queued = []
+    skipped = []
+    for file_name, doc_data, authors_data in documents:
+       file_path = extracted.pop(file_name, None)
+       if file_path is None:
+          skipped.append({"file": file_name, "reason": "File not found in archive"})
+          continue
+       content_hash = file_sha256(file_path)
+       duplicate = db.query(Document).filter((Document.document_name == doc_data.document_name) | (Document.content_hash == content_hash)).first()
+       if duplicate:
+          os.remove(file_path)
+          skipped.append({"file": file_name, "reason": f"Already uploaded as '{duplicate.document_name}'"})
+          continue
+       spool_path = None
+       try:
+          spool_path = spool_file(file_path)
+          doc, job = queue_document(db, doc_data, authors_data, user_id, spool_path, content_hash)
+          db.commit()
+          queued.append({"file": file_name, "doc_id": doc.document_id, "job_id": job.job_id})
+       except IntegrityError:
+          # The same PDF was committed by a concurrent upload after the check above
+          db.rollback()
+          remove_spooled(spool_path)
+          duplicate = db.query(Document).filter(Document.content_hash == content_hash).first()
+          skipped.append({"file": file_name, "reason": f"Already uploaded as '{duplicate.document_name}'" if duplicate else "Already uploaded"})
+       except Exception as e:
+          db.rollback()
+          if os.path.exists(file_path):
+             os.remove(file_path)
+          remove_spooled(spool_path)
+          skipped.append({"file": file_name, "reason": str(e)})
+
+    # PDFs in the archive that the manifest did not describe
+    for file_name, file_path in extracted.items():
+       os.remove(file_path)
+       skipped.append({"file": file_name, "reason": "Not listed in manifest"})
+
+    return queued, skipped
+
+
+@router.post('/bulk-upload')
+async def bulk_upload(manifest: str = Form(...), archive: UploadFile = File(...),
+                      db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """Queue every PDF of a ZIP archive for ingestion.
+
+    The manifest is a JSON list of {"file", "document_name", "subject", "document_link", "authors"}
+    entries, where "file" is the PDF's path inside the archive. Queued jobs are picked up in
+    batches by the ingest workers, which parse them in a process pool and share embedding batches.
+    """
+    try:
+       entries = json.loads(manifest)
+       documents = [
+          (entry["file"], DocumentCreate(**entry), [ConnectionCreate(**autho) for autho in entry.get("authors", [])])
+          for entry in entries
+       ]
+    except Exception as e:
+       raise HTTPException(status_code = status.HTTP_406_NOT_ACCEPTABLE, detail = "Not Acceptable JSON manifest")
+
+    batch_dir = os.path.join(settings.INGEST_SPOOL_DIR, f"bulk-{uuid.uuid4()}")
+    os.makedirs(batch_dir, exist_ok = True)
+    archive_path = os.path.join(batch_dir, "archive.zip")
+    try:
+       size = 0
+       with open(archive_path, "wb") as f:
+          while True:
+             part = await archive.read(1024 * 1024)
+             if not part:
+                break
+             size += len(part)
+             if size > settings.BULK_UPLOAD_MAX_MB * 1024 * 1024:
+                raise Exception(f"Too large of an archive. (Max Upload: {settings.BULK_UPLOAD_MAX_MB}MB)")
+             f.write(part)
+       # Extraction and hashing are blocking disk work, kept off the event loop
+       extracted = await asyncio.to_thread(
+          extract_archive, archive_path, batch_dir,
+          max_bytes = settings.BULK_EXTRACT_MAX_MB * 1024 * 1024, max_files = settings.BULK_MAX_FILES
+       )
+    except Exception as e:
+       shutil.rmtree(batch_dir, ignore_errors = True)
+       raise HTTPException(status_code = status.HTTP_406_NOT_ACCEPTABLE, detail = f"Not Acceptable ZIP archive: {e}")
+    finally:
+       if os.path.exists(archive_path):
+          os.remove(archive_path)
+
+    try:
+       # Hashing, duplicate checks, spooling and one commit per document: all blocking, so kept off the event loop
+       queued, skipped = await asyncio.to_thread(queue_bulk, db, documents, extracted, current_user.user_id)
+    finally:
+       shutil.rmtree(batch_dir, ignore_errors = True)
+    return {"error": False, "queued": queued, "skipped": skipped}
+
 @router.get('/all-papers')
 def get_all_papers(db: Session = Depends(get_db)):
    try:
@@ -163,8 +281,22 @@ def delete_document(document: DocumentDelete,db: Session = Depends(get_db), curr
          doc_uploader = doc.uploaded_by
          if current_user.user_id == doc_uploader:
             title = doc.document_name
-            message = weaviate_client.delete(title)
+            document_id = doc.document_id
+            # Cancel its pending jobs; a job already running sees the Document is gone and cleans up after itself
+            jobs = db.query(IngestJob).filter(IngestJob.document_id == document_id, IngestJob.status.in_(["queued", "running"])).all()
+            for job in jobs:
+               if job.status == "queued":
+                  remove_spooled(job.file_path)
+               job.status = "cancelled"
+               job.document_id = None
             db.delete(doc)
+            # Commit before deleting vectors, so a worker that finishes later no longer finds the Document
+            db.commit()
+            message = vector_store.delete_document(document_id, title)
+            if not message["success"]:
+               # Documents ingested before chunks carried document_id can only be found by title
+               message = vector_store.delete(title)
+            bump_shared_corpus_version(db)
             db.commit()
             if message["success"]:
                return {"success":True, "message":f"{message['message']}"}
@@ -208,3 +340,59 @@ def document_details(doc_id: int, db: Session = Depends(get_db), current_user: U
          raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail = "Document not found")
    except Exception as e:
       raise HTTPException(status_code = status.HTTP_500_INTERNAL_SERVER_ERROR, detail = "Error in fetching document details!")
+
+
+@router.get('/job-status')
+def job_status(job_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+   job = db.query(IngestJob).filter(IngestJob.job_id == job_id).first()
+   if not job:
+      raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail = "Ingest job not found")
+   return JobSchema.model_validate(job)
+
+def ingest_status_of(job):
+   result = IngestStatus.model_validate(job)
+   if job.pages and job.parse_seconds:
+      result.pages_per_second = round(job.pages / job.parse_seconds, 2)
+   if job.chunks and job.embed_seconds:
+      result.embed_chunks_per_second = round(job.chunks / job.embed_seconds, 2)
+   return result
+
+def histogram(values, bins):
+   if not values:
+      return []
+   low, high = min(values), max(values)
+   width = (high - low) / bins if high > low else 1.0
+   counts = [0] * bins
+   for value in values:
+      counts[min(int((value - low) / width), bins - 1)] += 1
+   return [
+      {"from": round(low + index * width, 4), "to": round(low + (index + 1) * width, 4), "count": count}
+      for index, count in enumerate(counts)
+   ]
+
+@router.get('/ingest-status')
+def ingest_status(doc_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+   job = db.query(IngestJob).filter(IngestJob.document_id == doc_id).order_by(IngestJob.created_at.desc()).first()
+   if not job:
+      raise HTTPException(status_code = status.HTTP_404_NOT_FOUND, detail = "No ingest job found for this document")
+   return ingest_status_of(job)
+
+@router.get('/ingest-status/histogram')
+def ingest_histogram(bins: int = 10, limit: int = 1000, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+   bins = max(1, min(bins, 100))
+   jobs = db.query(IngestJob).filter(IngestJob.status == "done", IngestJob.total_seconds != None).order_by(IngestJob.created_at.desc()).limit(limit).all()
+   total_seconds = [job.total_seconds for job in jobs]
+   pages_per_second = [job.pages / job.parse_seconds for job in jobs if job.pages and job.parse_seconds]
+   chunks_per_second = [job.chunks / job.embed_seconds for job in jobs if job.chunks and job.embed_seconds]
+   slowest = sorted(jobs, key = lambda job: job.total_seconds, reverse = True)[:10]
+   return {
+      "error": False,
+      "documents": len(jobs),
+      "total_seconds": histogram(total_seconds, bins),
+      "pages_per_second": histogram(pages_per_second, bins),
+      "embed_chunks_per_second": histogram(chunks_per_second, bins),
+      "slowest": [
+         {"job_id": job.job_id, "document_name": job.document_name, "pages": job.pages, "total_seconds": job.total_seconds}
+         for job in slowest
+      ]
+   }
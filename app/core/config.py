@@ -28,6 +28,122 @@ class Settings(BaseSettings):
     AWS_BUCKET_NAME: str = "locubucket"
 
     WEAVIATE_URL: str = os.getenv("WEAVIATE_URL", "https://weaviate-production-91e5.up.railway.app")
+    # Connection pool of the async client used by the chat endpoints
+    WEAVIATE_MAX_CONNECTIONS: int = int(os.getenv("WEAVIATE_MAX_CONNECTIONS", "50"))
+    WEAVIATE_KEEPALIVE_CONNECTIONS: int = int(os.getenv("WEAVIATE_KEEPALIVE_CONNECTIONS", "20"))
+    WEAVIATE_TIMEOUT_SECONDS: float = float(os.getenv("WEAVIATE_TIMEOUT_SECONDS", "10"))
+    # /chats/batch-search: queries per request, nearVector searches per GraphQL request, concurrent LLM answers
+    BATCH_SEARCH_MAX_QUERIES: int = int(os.getenv("BATCH_SEARCH_MAX_QUERIES", "1000"))
+    BATCH_SEARCH_GROUP: int = int(os.getenv("BATCH_SEARCH_GROUP", "16"))
+    BATCH_ANSWER_CONCURRENCY: int = int(os.getenv("BATCH_ANSWER_CONCURRENCY", "8"))
+
+    # Weaviate vector index. ef -1 lets Weaviate pick it per query from the limit; ef can be
+    # changed on a live class, efConstruction/maxConnections and BQ need scripts/weaviate_reindex.py
+    HNSW_EF: int = int(os.getenv("HNSW_EF", "-1"))
+    HNSW_EF_CONSTRUCTION: int = int(os.getenv("HNSW_EF_CONSTRUCTION", "128"))
+    HNSW_MAX_CONNECTIONS: int = int(os.getenv("HNSW_MAX_CONNECTIONS", "64"))
+    # "none", "pq" (product quantization) or "bq" (binary quantization)
+    VECTOR_COMPRESSION: str = os.getenv("VECTOR_COMPRESSION", "none")
+    PQ_SEGMENTS: int = int(os.getenv("PQ_SEGMENTS", "0"))
+    PQ_TRAINING_LIMIT: int = int(os.getenv("PQ_TRAINING_LIMIT", "100000"))
+
+    # "weaviate" or "numpy" (in-process, memory-mapped; for single-node deployments and tests)
+    VECTOR_STORE: str = os.getenv("VECTOR_STORE", "weaviate")
+    NUMPY_STORE_DIR: str = os.getenv("NUMPY_STORE_DIR", "./vector_store")
+    NUMPY_STORE_DTYPE: str = os.getenv("NUMPY_STORE_DTYPE", "float32")
+
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "intfloat/e5-base")
+    # "torch" runs SentenceTransformer; "onnx" exports the model once and runs it through onnxruntime
+    EMBEDDING_BACKEND: str = os.getenv("EMBEDDING_BACKEND", "torch")
+    ONNX_MODEL_DIR: str = os.getenv("ONNX_MODEL_DIR", "./onnx_models/e5-base")
+    ONNX_QUANTIZE: bool = os.getenv("ONNX_QUANTIZE", "false").lower() == "true"
+    ONNX_THREADS: int = int(os.getenv("ONNX_THREADS", "0"))
+    EMBED_MAX_LENGTH: int = int(os.getenv("EMBED_MAX_LENGTH", "512"))
+    EMBED_BATCH_SIZE: int = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+    EMBED_NORMALIZE: bool = os.getenv("EMBED_NORMALIZE", "true").lower() == "true"
+
+    # Number of query vectors kept in the in-process LRU; 0 disables it
+    QUERY_CACHE_SIZE: int = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+    # Answers reused for near-duplicate questions (0 entries disables). The corpus version only
+    # tracks this process's writes, so with out-of-process ingest workers the TTL bounds staleness.
+    ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+    ANSWER_CACHE_TTL_SECONDS: int = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_SIMILARITY: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.97"))
+
+    # OpenAI clients are pooled per API key and share one HTTP connection pool
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")
+    LLM_POOL_SIZE: int = int(os.getenv("LLM_POOL_SIZE", "256"))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "20"))
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+
+    # Prompt tokens (tiktoken) given to retrieved passages, after overlapping chunks are merged
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+    # Chat messages sent verbatim with follow-up questions; older ones are folded into Chat.summary
+    CHAT_RECENT_MESSAGES: int = int(os.getenv("CHAT_RECENT_MESSAGES", "6"))
+
+    # Per-stage limits of the async chat endpoints (0 = none)
+    TITLE_TIMEOUT_SECONDS: float = float(os.getenv("TITLE_TIMEOUT_SECONDS", "10"))
+    RETRIEVAL_TIMEOUT_SECONDS: float = float(os.getenv("RETRIEVAL_TIMEOUT_SECONDS", "10"))
+    ANSWER_TIMEOUT_SECONDS: float = float(os.getenv("ANSWER_TIMEOUT_SECONDS", "60"))
+
+    # Compact Weaviate layout: sentences and document metadata live once in this SQLite file and
+    # objects keep only a sentence reference. Empty keeps the text on every object.
+    SENTENCE_STORE_PATH: str = os.getenv("SENTENCE_STORE_PATH", "")
+
+    # "vector" or "hybrid" (BM25 + vector, fused by reciprocal rank)
+    RETRIEVAL_MODE: str = os.getenv("RETRIEVAL_MODE", "vector")
+    RETRIEVAL_LIMIT: int = int(os.getenv("RETRIEVAL_LIMIT", "20"))
+    # Default minimum certainty of hits sent to the LLM; can be overridden per request
+    RETRIEVAL_CERTAINTY: float = float(os.getenv("RETRIEVAL_CERTAINTY", "0.9"))
+    # Weaviate autocut jumps (0 disables); trims the result list at large distance gaps
+    RETRIEVAL_AUTOCUT: int = int(os.getenv("RETRIEVAL_AUTOCUT", "0"))
+    HYBRID_VECTOR_WEIGHT: float = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+    HYBRID_KEYWORD_WEIGHT: float = float(os.getenv("HYBRID_KEYWORD_WEIGHT", "1.0"))
+    RRF_K: int = int(os.getenv("RRF_K", "60"))
+    # Minimum BM25 score of hybrid hits that only keyword search found (they have no certainty to cut on)
+    KEYWORD_MIN_SCORE: float = float(os.getenv("KEYWORD_MIN_SCORE", "1.0"))
+
+    # Optional cross-encoder reranking between retrieval and prompt construction
+    RERANKER_ENABLED: bool = os.getenv("RERANKER_ENABLED", "false").lower() == "true"
+    RERANKER_MODEL: str = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    RERANK_TOP_N: int = int(os.getenv("RERANK_TOP_N", "5"))
+    RERANK_BATCH_SIZE: int = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+    # Reranking is skipped when retrieval plus reranking would exceed this many ms
+    RERANK_BUDGET_MS: int = int(os.getenv("RERANK_BUDGET_MS", "400"))
+
+    PDF_PARSE_WORKERS: int = int(os.getenv("PDF_PARSE_WORKERS", "1"))
+    PDF_PARALLEL_MIN_PAGES: int = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "40"))
+
+    # Leave EMBED_CACHE_PATH empty to disable the on-disk embedding cache
+    EMBED_CACHE_PATH: str = os.getenv("EMBED_CACHE_PATH", "")
+    EMBED_CACHE_MAX_ENTRIES: int = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "500000"))
+    EMBED_CACHE_DTYPE: str = os.getenv("EMBED_CACHE_DTYPE", "float16")
+
+    INGEST_QUEUE_SIZE: int = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+
+    # Uploaded PDFs wait in the spool until an ingest worker picks up their job. "s3" keeps them in
+    # AWS_BUCKET_NAME under INGEST_SPOOL_PREFIX, where every instance and worker can reach them;
+    # "local" keeps them in INGEST_SPOOL_DIR, which is only safe when workers share that disk
+    INGEST_SPOOL_STORAGE: str = os.getenv("INGEST_SPOOL_STORAGE", "s3" if os.getenv("AWS_ACCESS_KEY") else "local")
+    INGEST_SPOOL_PREFIX: str = os.getenv("INGEST_SPOOL_PREFIX", "ingest-spool/")
+    # Local spool, and scratch space for extracting bulk-upload archives
+    INGEST_SPOOL_DIR: str = os.getenv("INGEST_SPOOL_DIR", "./ingest_spool")
+    INGEST_MAX_ATTEMPTS: int = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+    INGEST_WORKER_CONCURRENCY: int = int(os.getenv("INGEST_WORKER_CONCURRENCY", "2"))
+    # Worker threads started inside the API process. The Cloud Run deploy (cloudbuild.yaml) sets it
+    # to 1; set it to 0 when running `python -m app.worker` next to the API instead
+    INGEST_WORKERS_IN_PROCESS: int = int(os.getenv("INGEST_WORKERS_IN_PROCESS", "1"))
+    INGEST_POLL_SECONDS: float = float(os.getenv("INGEST_POLL_SECONDS", "2"))
+    # Queued jobs a worker claims together and ingests as one bulk batch
+    INGEST_BATCH_DOCS: int = int(os.getenv("INGEST_BATCH_DOCS", "8"))
+    BULK_PARSE_WORKERS: int = int(os.getenv("BULK_PARSE_WORKERS", str(os.cpu_count() or 2)))
+    BULK_UPLOAD_MAX_MB: int = int(os.getenv("BULK_UPLOAD_MAX_MB", "200"))
+    # Limits on what a bulk-upload archive may expand to on the spool disk
+    BULK_EXTRACT_MAX_MB: int = int(os.getenv("BULK_EXTRACT_MAX_MB", "1000"))
+    BULK_MAX_FILES: int = int(os.getenv("BULK_MAX_FILES", "500"))
+    INGEST_JOB_LEASE_SECONDS: int = int(os.getenv("INGEST_JOB_LEASE_SECONDS", "1800"))
 
 settings = Settings()
 
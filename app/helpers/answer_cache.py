@@ -0,0 +1,99 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.config import settings
+
+
+class AnswerCache(object):
+    """In-process cache of generated answers, looked up by query-embedding similarity.
+
+    A stored answer is served for any later query whose embedding has cosine similarity of
+    at least `similarity` with the original, under the same certainty and filters. Entries
+    are tagged with the vector store's corpus version and are dropped once it changes,
+    after `ttl_seconds`, or in least-recently-used order beyond `max_entries`.
+    """
+    def __init__(self, max_entries = 1000, ttl_seconds = 3600, similarity = 0.97):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+        self._next_key = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def scope(certainty, filters):
+        return json.dumps([certainty, filters or {}], sort_keys = True)
+
+    @staticmethod
+    def unit(vector):
+        vector = np.asarray(vector, dtype = np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def get(self, vector, scope, corpus_version):
+        vector = self.unit(vector)
+        now = time.time()
+        with self._lock:
+            best_key, best_similarity = None, self.similarity
+            for key, entry in list(self._entries.items()):
+                if entry["version"] != corpus_version:
+                    del self._entries[key]
+                    self.invalidated += 1
+                    continue
+                if now - entry["created"] > self.ttl_seconds:
+                    del self._entries[key]
+                    self.expired += 1
+                    continue
+                if entry["scope"] != scope:
+                    continue
+                similarity = float(entry["vector"] @ vector)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key]["answer"]
+
+    def put(self, vector, scope, corpus_version, answer):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[self._next_key] = {
+                "vector": self.unit(vector),
+                "scope": scope,
+                "version": corpus_version,
+                "created": time.time(),
+                "answer": answer
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "expired": self.expired,
+                "invalidated": self.invalidated,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries
+            }
+
+
+ANSWER_CACHE = AnswerCache(
+    max_entries = settings.ANSWER_CACHE_SIZE,
+    ttl_seconds = settings.ANSWER_CACHE_TTL_SECONDS,
+    similarity = settings.ANSWER_CACHE_SIMILARITY
+) if settings.ANSWER_CACHE_SIZE > 0 else None
@@ -0,0 +1,12 @@
+from app.db.database import SessionLocal
+from app.models.document import AuthorConnection
+
+
+def document_ids_by_author(author):
+    """Ids of the documents that list `author`, matched on the exact name, among their authors."""
+    db = SessionLocal()
+    try:
+        rows = db.query(AuthorConnection.document_conn).filter(AuthorConnection.authorname == author).distinct().all()
+        return sorted(row[0] for row in rows if row[0] is not None)
+    finally:
+        db.close()
@@ -0,0 +1,52 @@
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.chats import Chat, ChatMessage
+
+
+def as_history(messages):
+    return [{"role":message.role, "content":message.content} for message in messages]
+
+
+def recent_messages(db, chat_id, limit = None):
+    """The last `limit` messages of a chat in the order they were sent; older ones live in Chat.summary."""
+    limit = limit or settings.CHAT_RECENT_MESSAGES
+    messages = db.query(ChatMessage).filter(ChatMessage.parent_chat_id == chat_id).order_by(ChatMessage.message_id.desc()).limit(limit).all()
+    return list(reversed(messages))
+
+
+def update_chat_summary(chat_id, api_key = None):
+    """Fold messages that have left the recent window into the chat's rolling summary.
+
+    Runs after the response is sent. Only messages newer than the last summarized one are
+    read, and the summary is written only if no concurrent update got there first.
+    """
+    from app.helpers.llm import ANSWER_CREATOR
+    db = SessionLocal()
+    try:
+        chat = db.query(Chat).filter(Chat.chat_id == chat_id).first()
+        if chat is None:
+            return
+        window = recent_messages(db, chat_id)
+        if not window:
+            return
+        summarized_until = chat.summarized_until or 0
+        stale = db.query(ChatMessage).filter(
+            ChatMessage.parent_chat_id == chat_id,
+            ChatMessage.message_id > summarized_until,
+            ChatMessage.message_id < window[0].message_id
+        ).order_by(ChatMessage.message_id.asc()).all()
+        if not stale:
+            return
+        summary = ANSWER_CREATOR.summarize(chat.summary, as_history(stale), api_key = api_key)
+        updated = db.query(Chat).filter(
+            Chat.chat_id == chat_id,
+            (Chat.summarized_until == chat.summarized_until) if chat.summarized_until is not None else Chat.summarized_until.is_(None)
+        ).update({"summary": summary, "summarized_until": stale[-1].message_id}, synchronize_session = False)
+        db.commit()
+        if not updated:
+            print(f"Chat {chat_id} summary was updated concurrently; skipped")
+    except Exception as e:
+        db.rollback()
+        print(f"Error updating summary of chat {chat_id}: {e}")
+    finally:
+        db.close()
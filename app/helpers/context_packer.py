@@ -0,0 +1,109 @@
+import re
+import threading
+
+import tiktoken
+
+# The same sentence split page_chunks uses, so chunk texts split back into their sentences
+SENTENCE_SPLIT = re.compile(r'(?<=[.?!])\s+')
+
+
+def contains(passage, sentences):
+    size = len(sentences)
+    return any(passage[start:start + size] == sentences for start in range(len(passage) - size + 1))
+
+
+def stitch(passage, sentences):
+    """Join two sentence lists that overlap at an edge, or return None if they do not."""
+    if contains(passage, sentences):
+        return passage
+    if contains(sentences, passage):
+        return sentences
+    for overlap in range(min(len(passage), len(sentences)) - 1, 0, -1):
+        if passage[-overlap:] == sentences[:overlap]:
+            return passage + sentences[overlap:]
+        if sentences[-overlap:] == passage[:overlap]:
+            return sentences + passage[overlap:]
+    return None
+
+
+class ContextPacker(object):
+    """Builds the prompt context from retrieved hits within a token budget.
+
+    Hits are grouped per paper, in order of their best-ranked hit. Within a paper the
+    sliding-window chunks are stitched back into passages wherever they overlap, and
+    sentences already emitted are dropped. Passages are then admitted in the rank order of
+    their best hit, across papers, until the next one no longer fits `token_budget`
+    (counted with the model's tiktoken encoding). The admitted passages are rendered
+    grouped per paper, with each paper's source, title and authors written once after
+    its passages.
+    """
+    def __init__(self, token_budget = 3000, model = "gpt-3.5-turbo"):
+        self.token_budget = token_budget
+        self.model = model
+        self._encoding = None
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        with self._lock:
+            if self._encoding is None:
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("cl100k_base")
+            return self._encoding
+
+    def count(self, text):
+        return len(self.encoding.encode(text))
+
+    def papers(self, hits):
+        """Group hits by paper and merge each paper's overlapping chunks into passages.
+
+        Each passage is {"sentences", "rank"}, where rank is the position of the best hit
+        merged into it.
+        """
+        papers = {}
+        for rank, hit in enumerate(hits):
+            key = (hit['title'], hit['source'])
+            paper = papers.setdefault(key, {"title":hit['title'], "source":hit['source'], "authors":hit['authors'], "passages":[]})
+            merged = {"sentences":[sentence for sentence in SENTENCE_SPLIT.split(hit['text'].strip()) if sentence], "rank":rank}
+            remaining = []
+            for passage in paper["passages"]:
+                stitched = stitch(passage["sentences"], merged["sentences"])
+                if stitched is None:
+                    remaining.append(passage)
+                    continue
+                merged = {"sentences":stitched, "rank":min(passage["rank"], merged["rank"])}
+            remaining.append(merged)
+            paper["passages"] = sorted(remaining, key = lambda passage: passage["rank"])
+        return list(papers.values())
+
+    def footer(self, paper):
+        return "Source: " + paper['source'] + "\n" + "Title of Paper: " + paper['title'] + "\n" + "Authors: " + ', '.join(paper['authors']) + "\n"
+
+    def pack(self, hits):
+        papers = self.papers(hits)
+        candidates = sorted(
+            ((passage["rank"], index, passage["sentences"]) for index, paper in enumerate(papers) for passage in paper["passages"]),
+            key = lambda candidate: candidate[0]
+        )
+        seen = set()
+        admitted = {}
+        used = 0
+        # Admission follows hit rank across papers; grouping by paper only happens when rendering
+        for rank, index, passage in candidates:
+            sentences = [sentence for sentence in passage if " ".join(sentence.split()) not in seen]
+            if not sentences:
+                continue
+            text = " ".join(sentences)
+            cost = self.count(text) + 1 + (0 if index in admitted else self.count(self.footer(papers[index])) + 2)
+            if used + cost > self.token_budget:
+                # Stop rather than skip, so a cheaper lower-ranked passage never displaces this one
+                break
+            used += cost
+            admitted.setdefault(index, []).append(text)
+            seen.update(" ".join(sentence.split()) for sentence in sentences)
+        blocks = []
+        for index, passages in admitted.items():
+            blocks.append(f"{len(blocks) + 1}) " + "\n".join(passages) + "\n" + self.footer(papers[index]))
+        return "".join(blocks)
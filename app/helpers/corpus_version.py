@@ -0,0 +1,20 @@
+from app.db.database import SessionLocal
+from app.models.document import CorpusVersion
+
+
+def bump_shared_corpus_version(db):
+    """Increment the shared corpus version inside `db`'s transaction; the caller commits."""
+    updated = db.query(CorpusVersion).filter(CorpusVersion.id == 1).update(
+        {"version": CorpusVersion.version + 1}, synchronize_session = False
+    )
+    if not updated:
+        db.add(CorpusVersion(id = 1, version = 1))
+
+
+def shared_corpus_version():
+    db = SessionLocal()
+    try:
+        row = db.query(CorpusVersion.version).filter(CorpusVersion.id == 1).first()
+        return row[0] if row else 0
+    finally:
+        db.close()
@@ -0,0 +1,245 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+import zipfile
+from concurrent.futures import as_completed
+
+from app.core.config import settings
+
+_DONE = object()
+
+
+class StageStats(object):
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.chunks = 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "items": self.items,
+            "chunks": self.chunks,
+            "seconds": round(self.seconds, 4),
+            "chunks_per_second": round(self.chunks / self.seconds, 2) if self.seconds else 0.0
+        }
+
+
+class IngestPipeline(object):
+    """Overlaps PDF parsing, embedding and vector-store writes using bounded queues.
+
+    Parsing runs in one thread and embedding in another, while the calling thread
+    writes to the vector store. The queues are bounded, so at most a few batches are
+    held in memory no matter how large the document is.
+    """
+    def __init__(self, vectordb, batch_size = None, queue_size = None):
+        self.vectordb = vectordb
+        self.batch_size = batch_size or settings.EMBED_BATCH_SIZE
+        self.queue_size = queue_size or settings.INGEST_QUEUE_SIZE
+
+    def embed(self, texts):
+        # Imported here so that importing this module (as the parse-pool workers do) never loads the model
+        from app.helpers.weaviate import embed_texts
+        return embed_texts(texts, batch_size = self.batch_size)
+
+    def _put(self, target, item, stop):
+        while not stop.is_set():
+            try:
+                target.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source, stop):
+        while not stop.is_set():
+            try:
+                return source.get(timeout = 0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _parse(self, pages, parsed, stats, errors, stop):
+        try:
+            pages = iter(pages)
+            while not stop.is_set():
+                start = time.perf_counter()
+                chunks = next(pages, _DONE)
+                stats.seconds += time.perf_counter() - start
+                if chunks is _DONE:
+                    break
+                stats.items += 1
+                stats.chunks += len(chunks)
+                if chunks and not self._put(parsed, chunks, stop):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            self._put(parsed, _DONE, stop)
+
+    def _embed(self, parsed, embedded, stats, errors, stop):
+        pending = []
+        try:
+            while True:
+                chunks = self._get(parsed, stop)
+                if stop.is_set():
+                    break
+                if chunks is not _DONE:
+                    pending.extend(chunks)
+                while pending and (len(pending) >= self.batch_size or chunks is _DONE):
+                    batch, pending = pending[:self.batch_size], pending[self.batch_size:]
+                    start = time.perf_counter()
+                    vectors = self.embed([chunk["text"] for chunk in batch])
+                    stats.seconds += time.perf_counter() - start
+                    stats.items += 1
+                    stats.chunks += len(batch)
+                    if not self._put(embedded, (batch, vectors), stop):
+                        return
+                if chunks is _DONE:
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            self._put(embedded, _DONE, stop)
+
+    def run(self, pages):
+        """Ingest an iterable of per-page chunk lists and return per-stage throughput counters."""
+        parsed = queue.Queue(maxsize = self.queue_size)
+        embedded = queue.Queue(maxsize = self.queue_size)
+        stop = threading.Event()
+        errors = []
+        stats = {name: StageStats(name) for name in ("parse", "embed", "write")}
+
+        start_time = time.perf_counter()
+        workers = [
+            threading.Thread(target = self._parse, args = (pages, parsed, stats["parse"], errors, stop), daemon = True),
+            threading.Thread(target = self._embed, args = (parsed, embedded, stats["embed"], errors, stop), daemon = True)
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            while True:
+                item = self._get(embedded, stop)
+                if item is _DONE:
+                    break
+                batch, vectors = item
+                write_start = time.perf_counter()
+                self.vectordb.write_chunks(batch, vectors)
+                stats["write"].seconds += time.perf_counter() - write_start
+                stats["write"].items += 1
+                stats["write"].chunks += len(batch)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if errors:
+                stop.set()
+            for worker in workers:
+                worker.join()
+
+        if errors:
+            raise errors[0]
+
+        result = {name: stage.as_dict() for name, stage in stats.items()}
+        result["total_seconds"] = round(time.perf_counter() - start_time, 4)
+        result["chunks"] = stats["write"].chunks
+        return result
+
+
+def manifest_entries(doc_directory, manifest):
+    """Turn a folder manifest into bulk_ingest entries with absolute file paths."""
+    if isinstance(manifest, dict):
+        manifest = [dict(entry, file = filename) for filename, entry in manifest.items()]
+    entries = []
+    for entry in manifest:
+        entries.append({
+            "file_path": os.path.join(doc_directory, entry["file"]),
+            "title": entry["title"],
+            "authors": entry.get("authors", []),
+            "link": entry.get("link", entry["file"]),
+            "metadata": {"subject": entry.get("subject"), "document_id": entry.get("document_id")}
+        })
+    return entries
+
+
+def extract_archive(archive_path, target_dir, max_bytes = None, max_files = None):
+    """Extract the PDFs of a ZIP archive into target_dir, refusing paths that escape it.
+
+    `max_bytes` caps the total uncompressed size and `max_files` the number of PDFs. The
+    declared sizes are checked before anything is written, and the bytes actually written
+    are counted too, since member headers can understate them.
+    """
+    extracted = {}
+    root = os.path.realpath(target_dir)
+    with zipfile.ZipFile(archive_path) as archive:
+        members = [member for member in archive.infolist() if not member.is_dir() and member.filename.lower().endswith(".pdf")]
+        if max_files is not None and len(members) > max_files:
+            raise ValueError(f"Too many PDFs in archive ({len(members)}, max {max_files})")
+        if max_bytes is not None and sum(member.file_size for member in members) > max_bytes:
+            raise ValueError(f"Archive expands past the {max_bytes // (1024 * 1024)}MB limit")
+        written = 0
+        for member in members:
+            destination = os.path.realpath(os.path.join(root, member.filename))
+            if not destination.startswith(root + os.sep):
+                raise ValueError(f"Unsafe path in archive: {member.filename}")
+            os.makedirs(os.path.dirname(destination), exist_ok = True)
+            with archive.open(member) as source, open(destination, "wb") as target:
+                while True:
+                    part = source.read(1024 * 1024)
+                    if not part:
+                        break
+                    written += len(part)
+                    if max_bytes is not None and written > max_bytes:
+                        raise ValueError(f"Archive expands past the {max_bytes // (1024 * 1024)}MB limit")
+                    target.write(part)
+            extracted[member.filename] = destination
+    return extracted
+
+
+def file_sha256(file_path):
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            part = f.read(1024 * 1024)
+            if not part:
+                break
+            hasher.update(part)
+    return hasher.hexdigest()
+
+
+def bulk_ingest(vectordb, entries, workers = None):
+    """Ingest many PDFs at once.
+
+    Files are parsed in a process pool and fed into one IngestPipeline as they finish,
+    so embedding batches span document boundaries and writes stream to the vector
+    store while other files are still parsing. A file that fails to parse is reported
+    and skipped; an embedding or write failure aborts the whole run.
+    """
+    from app.helpers.pdf_chunks import load_file, parse_pool
+    workers = workers or settings.BULK_PARSE_WORKERS
+    documents = [{"file_path": entry["file_path"], "title": entry["title"], "error": None} for entry in entries]
+
+    def parsed_files(pool):
+        futures = {
+            pool.submit(load_file, entry["file_path"], entry["title"], entry["authors"], entry["link"], entry.get("metadata")): index
+            for index, entry in enumerate(entries)
+        }
+        for future in as_completed(futures):
+            report = documents[futures[future]]
+            try:
+                chunks, pages, seconds = future.result()
+            except Exception as e:
+                print(f"Error parsing {report['file_path']}: {e}")
+                report["error"] = str(e)
+                continue
+            report.update({"pages": pages, "chunks": len(chunks), "parse_seconds": round(seconds, 4)})
+            yield chunks
+
+    with parse_pool(max(min(workers, len(entries)), 1)) as pool:
+        stats = IngestPipeline(vectordb).run(parsed_files(pool))
+    print(f"Bulk ingest of {len(entries)} files finished in {stats['total_seconds']:.2f}s, {stats['chunks']} chunks")
+    return {"documents": documents, "pipeline": stats}
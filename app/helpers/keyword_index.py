@@ -0,0 +1,83 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+TOKEN_PATTERN = re.compile(r"\w[\w\-\.]*\w|\w")
+# Dropped from queries (the index keeps them): on their own they match nearly every row
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not now of off on once only or other our
+ours out over own same she should so some such than that the their theirs them then there these they this those
+through to too under until up very was we were what when where which while who whom why will with would you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercased word tokens that keep identifiers like 'BRCA1', 'GSE-1234' or 'eq.3' intact."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def query_terms(query):
+    return set(tokenize(query)) - STOPWORDS
+
+
+class BM25Index(object):
+    """Incremental in-memory inverted index scored with Okapi BM25.
+
+    Documents are identified by integer ids chosen by the caller (row numbers in the
+    NumPy store). add() updates the postings in place; there is no removal, because a
+    delete renumbers the rows after it, so the NumPy store rebuilds the index instead.
+    """
+    def __init__(self, k1 = 1.2, b = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)
+        self.lengths = {}
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def add(self, doc_id, text):
+        terms = Counter(tokenize(text))
+        with self._lock:
+            for term, count in terms.items():
+                self.postings[term][doc_id] = count
+            length = sum(terms.values())
+            self.lengths[doc_id] = length
+            self.total_length += length
+
+    def search(self, query, limit = 20, allowed = None):
+        """Return (doc_id, score) pairs for the best `limit` documents, restricted to `allowed` ids if given."""
+        with self._lock:
+            count = len(self.lengths)
+            if count == 0:
+                return []
+            average = self.total_length / count
+            scores = defaultdict(float)
+            for term in query_terms(query):
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, frequency in docs.items():
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average)
+                    scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key = lambda item: item[1], reverse = True)[:limit]
+
+
+def reciprocal_rank_fusion(ranked_lists, weights, k = 60):
+    """Fuse ranked hit lists by weighted reciprocal rank.
+
+    ranked_lists are lists of (key, hit) in rank order. Returns (key, hit, score) sorted by
+    fused score; when a key appears in several lists the first list's hit is kept.
+    """
+    scores = defaultdict(float)
+    hits = {}
+    for ranked, weight in zip(ranked_lists, weights):
+        for rank, (key, hit) in enumerate(ranked):
+            scores[key] += weight / (k + rank + 1)
+            hits.setdefault(key, hit)
+    return sorted(((key, hits[key], score) for key, score in scores.items()), key = lambda item: item[2], reverse = True)
@@ -1,11 +1,21 @@
 from torch._C import NoneType
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, TextIteratorStreamer
 import torch
 from dotenv import load_dotenv
-from app.api.routes.document import weaviate_client
+from app.api.routes.document import vector_store
+from app.core.config import settings
+from app.helpers.vectorstore import PROMPT_PROPERTIES
+from app.helpers.reranker import RERANKER
+from app.helpers.answer_cache import AnswerCache, ANSWER_CACHE
+from app.helpers.weaviate import embed_query
+from app.helpers.llm_pool import LLM_POOL
+from app.helpers.context_packer import ContextPacker
+from app.helpers.corpus_version import shared_corpus_version
 import os
-from langchain_openai import ChatOpenAI
 import json
+import time
+import asyncio
+import threading
 
 
 load_dotenv()
@@ -20,28 +30,37 @@ else:
 #tokenizer = AutoTokenizer.from_pretrained(MODEL_CHECKPOINT, trust_remote_code = True)
 
 
+CONTEXT_PACKER = ContextPacker(settings.CONTEXT_TOKEN_BUDGET)
+
+
+def llm_client(key = None):
+    """Pooled client for a user's API key, or for the server's own key."""
+    return LLM_POOL.get(key if key is not None else api_key)
+
+
+def is_relevant(res, threshold = 0.9):
+    # Keyword-only hits from hybrid retrieval carry no certainty; fuse() already dropped those under KEYWORD_MIN_SCORE
+    certainty = res['_additional'].get('certainty')
+    return certainty is None or certainty >= threshold
+
+
 class TitleCreator(object):
     def __init__(self, model, tokenizer):
         self.model = model
         self.tokenizer = tokenizer
-        self.llm = ChatOpenAI(api_key = api_key, model = "gpt-3.5-turbo", temperature = 0)
         self.prompt = "Write an appropriate title for the following Query: "
     
     def generate_query(self, query):
         if environment == "test":
-            self.messages = self.prompt + "\n" + query
-        else:
-            self.messages = [{"role":"system", "content":self.prompt}, {"role":"user", "content":query}]
+            return self.prompt + "\n" + query
+        return [{"role":"system", "content":self.prompt}, {"role":"user", "content":query}]
     
     def title(self, query, api_key = None):
-        if api_key is not None:
-            self.llm = ChatOpenAI(api_key = api_key, model = "gpt-3.5-turbo", temperature = 0)
         if environment == "test":
             if self.model is None and self.tokenizer is None:
                 raise ValueError("Model and tokenizer must be provided")
             try:
-                self.generate_query(query)
-                inputs = self.tokenizer(self.messages, return_tensors = "pt", padding = 'max_length', truncation = False)
+                inputs = self.tokenizer(self.generate_query(query), return_tensors = "pt", padding = 'max_length', truncation = False)
                 device = torch.device("mps")
                 inputs = {k:v.to(device) for k,v in inputs.items()}
                 output = self.model.generate(input_ids = inputs['input_ids']
@@ -51,153 +70,314 @@ class TitleCreator(object):
                                 max_new_tokens = 15,
                                 do_sample = True)
                 response = self.tokenizer.decode(output[0], skip_special_tokens=True)
-                self.generate_query("")
                 return {"error":False, "title":response}
             except Exception as e:
                 return {"error":True, "message":str(e)}
         else:
             try:
-                self.generate_query(query)
-                response = self.llm.invoke(self.messages)
+                response = llm_client(api_key).invoke(self.generate_query(query))
                 content = response.json()
                 answer = json.loads(content)['content']
                 return {"error":False, "title":answer}
             except Exception as e:
                 return {"error":True, "message":str(e)}
 
+    async def atitle(self, query, api_key = None):
+        if environment == "test":
+            return await asyncio.to_thread(self.title, query, api_key)
+        try:
+            response = await llm_client(api_key).ainvoke(self.generate_query(query))
+            content = response.json()
+            answer = json.loads(content)['content']
+            return {"error":False, "title":answer}
+        except Exception as e:
+            return {"error":True, "message":str(e)}
+
+
+async def timed(stage, awaitable, seconds):
+    """Await with a per-stage timeout (None or 0 for none), naming the stage in the error."""
+    try:
+        return await asyncio.wait_for(awaitable, seconds or None)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"{stage} timed out after {seconds}s")
+
+
+def context_block(results, certainty):
+    return CONTEXT_PACKER.pack([res for res in results if is_relevant(res, certainty)])
+
+
+def history_text(message_history, threshold = 10, summary = None):
+    history = ""
+    if summary:
+        history = "Summary of the earlier conversation: " + summary + "\n"
+    if len(message_history) > threshold:
+        message_history = message_history[-threshold:]
+    for message in  message_history:
+        history = history + message['role'] + ": " + message['content'] + "\n"
+    return history
+
 
 class AnswerFetcher(object):
     def __init__(self, model, tokenizer, vectordb):
         self.model = model
         self.tokenizer = tokenizer
         self.vectordb = vectordb
-        self.llm = ChatOpenAI(api_key = api_key, model = "gpt-3.5-turbo", temperature = 0)
     
-    def fetch(self, query):
+    async def afetch(self, query, certainty = None, properties = PROMPT_PROPERTIES, filters = None):
+        """Retrieve hits at or above `certainty` matching `filters`, returning None if the vector store failed."""
         try:
-            results = self.vectordb.retrieve(query)
+            results, timings = await self.vectordb.aretrieve_with_timings(query, certainty = certainty, properties = properties, filters = filters)
+            print("Retrieval timings: " + ", ".join(f"{stage} {seconds * 1000:.1f}ms" for stage, seconds in timings.items()))
             return results
         except Exception as e:
             print(e)
-            return []
+            return None
     
-    def generate(self, query, api_key = None):
-        if api_key is not None:
-            self.llm = ChatOpenAI(api_key = api_key, model = "gpt-3.5-turbo", temperature = 0)
-        try:
-            results = self.fetch(query)
-            if not results:
-                return {"error":True, "message":"Error in fetching data from VectorDB"}
-            if environment == "test":
-                if self.model is None and self.tokenizer is None:
-                    raise ValueError("Model and tokenizer must be provided")
+    def cached(self, query, certainty, filters):
+        """Look a query up in the answer cache, returning (answer or None, key to store a fresh answer under)."""
+        if ANSWER_CACHE is None:
+            return None, None
+        # The corpus version is read before retrieval so an answer built from an older corpus is never stored as current.
+        # The shared version covers documents ingested or deleted by other processes (the ingest workers)
+        key = (embed_query(query), AnswerCache.scope(certainty, filters), (self.vectordb.corpus_version, shared_corpus_version()))
+        return ANSWER_CACHE.get(*key), key
+
+    def remember(self, key, answer):
+        if key is not None:
+            ANSWER_CACHE.put(*key, answer)
+
+    def rerank(self, query, results, started, certainty):
+        """Reorder the usable hits with the cross-encoder and keep the best few, if it fits the time budget."""
+        if RERANKER is None:
+            return results
+        return RERANKER.rerank(query, [res for res in results if is_relevant(res, certainty)], started = started)
+
+    def answer_prompt(self, query, results, certainty, history = None):
+        """Build the local model's context string (test environment) or the chat messages for OpenAI."""
+        if environment == "test":
+            if history is None:
                 context = "Answer the following question based on the data provided to you: \n"
                 context = context + "Question: \n"
                 context = context + query.replace("query: ", "")
                 context = context + "\nProvided Data for answering Query: \n"
-                cont_num = 0
-                for ind, res in enumerate(results):
-                    if res['_additional']['certainty'] >= 0.9:
-                        context = context + f"{cont_num + 1}) " + res['text'] + '\n'
-                        context = context + "Source: " + res['source'] + "\n"
-                        context = context + "Title of Paper: " + res['title'] + "\n"
-                        context = context + "Authors: " + ', '.join(auth for auth in res['authors']) + "\n"
-                        cont_num += 1
+                context = context + context_block(results, certainty)
                 context = context + "\nProvide citations from the context you generated your answer in MLA Format"
-                inputs = self.tokenizer(context, return_tensors = "pt", padding = 'max_length', truncation = False)
-                device = torch.device("mps")
-                inputs = {k:v.to(device) for k,v in inputs.items()}
-                output = self.model.generate(input_ids = inputs['input_ids']
-                    , attention_mask = inputs['attention_mask'],
-                    num_beams = 1,
-                    top_p = 0.95,
-                    max_new_tokens = 200,
-                    do_sample = True)
-                response = self.tokenizer.decode(output[0], skip_special_tokens=True)
-                return {"error":False, "message":response}
             else:
-                prompt = "You are a Helpful Research Assisting Agent, tasked with generating a response to the query using data and context provided to you and create MLA Citations for your answers. I will provide you with the context and finally the query you need to answer."
-                message = "Context: \n"
-                cont_num = 0
-                for ind, res in enumerate(results):
-                    if res['_additional']['certainty'] >= 0.9:
-                        message = message + f"{cont_num + 1}) " + res['text'] + '\n'
-                        message = message + "Source: " + res['source'] + "\n"
-                        message = message + "Title of Paper: " + res['title'] + "\n"
-                        message = message + "Authors: " + ', '.join(auth for auth in res['authors']) + "\n"
-                        cont_num += 1
-                message = message + "\n" + "Query: \n" + query
-                messages = [{"role":"system", "content":prompt}, {"role":"user", "content":message}]
-                response = self.llm.invoke(messages)
-                content = response.json()
-                answer = json.loads(content)['content']
+                context = "You must answer the asked Query based on Chat History and Provided Context to you. I will first provide with the Chat History, the the Context and finally the Query. Use the provided data to answer the finally asked Query"
+                context = context + "\n" + "Chat History:\n" + history            
+                context = context + context_block(results, certainty)
+                context = context + "\n" + "Query:\n" + query
+                context = context + "\n" + "Provide citations from the context you generated your answer in MLA Format"
+            return context
+        if history is None:
+            prompt = "You are a Helpful Research Assisting Agent, tasked with generating a response to the query using data and context provided to you and create MLA Citations for your answers. I will provide you with the context and finally the query you need to answer."
+            message = "Context: \n" + context_block(results, certainty)
+            message = message + "\n" + "Query: \n" + query
+        else:
+            prompt = "You are a Helpful Research Assisting Agent, tasked with generating a response to the query using data and context provided to you, as well as our previous Chat Historyand create MLA Citations for your answers. I will provide you with the context, certain amount of chat history and finally the query you need to answer."
+            message = "Context: \n" + context_block(results, certainty)
+            message = message + "\n" + "Chat History:\n" + history
+            message = message + "\n" + "Query:\n" + query
+        return [{"role":"system", "content":prompt}, {"role":"user", "content":message}]
+
+    def local_inputs(self, context):
+        if self.model is None and self.tokenizer is None:
+            raise ValueError("Model and tokenizer must be provided")
+        inputs = self.tokenizer(context, return_tensors = "pt", padding = 'max_length', truncation = False)
+        device = torch.device("mps")
+        return {k:v.to(device) for k,v in inputs.items()}
+
+    def run_local(self, context):
+        inputs = self.local_inputs(context)
+        output = self.model.generate(input_ids = inputs['input_ids'],
+            attention_mask = inputs['attention_mask'],
+            num_beams = 1,
+            top_p = 0.95,
+            max_new_tokens = 200,
+            do_sample = True)
+        return self.tokenizer.decode(output[0], skip_special_tokens=True)
+
+    def stream_local(self, context):
+        """Run the local model on a background thread, yielding text as generate() decodes it."""
+        inputs = self.local_inputs(context)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt = True, skip_special_tokens = True)
+        threading.Thread(target = self.model.generate, kwargs = dict(input_ids = inputs['input_ids'],
+            attention_mask = inputs['attention_mask'],
+            num_beams = 1,
+            top_p = 0.95,
+            max_new_tokens = 200,
+            do_sample = True,
+            streamer = streamer)).start()
+        yield from streamer
+
+    def complete(self, prompt, llm):
+        if environment == "test":
+            return self.run_local(prompt)
+        response = llm.invoke(prompt)
+        content = response.json()
+        return json.loads(content)['content']
+
+    async def acomplete(self, prompt, llm):
+        if environment == "test":
+            return await asyncio.to_thread(self.run_local, prompt)
+        response = await llm.ainvoke(prompt)
+        content = response.json()
+        return json.loads(content)['content']
+
+    async def astream_completion(self, prompt, llm):
+        if environment == "test":
+            pieces = self.stream_local(prompt)
+            while True:
+                piece = await asyncio.to_thread(next, pieces, None)
+                if piece is None:
+                    return
+                if piece:
+                    yield piece
+        else:
+            async for chunk in llm.astream(prompt):
+                if chunk.content:
+                    yield chunk.content
+
+    async def astream(self, query, api_key = None, certainty = None, filters = None, message_history = None, threshold = 10, summary = None):
+        """Yield the answer in pieces as the model produces them; retrieval runs first and raises on failure.
+
+        Without `message_history` this answers a new search (and uses the answer cache);
+        with it, a follow-up in a chat, as acontinuous_response does.
+        """
+        started = time.perf_counter()
+        llm = llm_client(api_key)
+        certainty = settings.RETRIEVAL_CERTAINTY if certainty is None else certainty
+        history = None
+        cache_key = None
+        if message_history is None:
+            answer, cache_key = await asyncio.to_thread(self.cached, query, certainty, filters)
+            if answer is not None:
+                yield answer
+                return
+            results = await timed("Retrieval", self.afetch(query, certainty = certainty, filters = filters), settings.RETRIEVAL_TIMEOUT_SECONDS)
+        else:
+            history = history_text(message_history, threshold, summary)
+            results = await timed("Retrieval", self.afetch(history, certainty = certainty, filters = filters), settings.RETRIEVAL_TIMEOUT_SECONDS)
+        if results is None:
+            raise RuntimeError("Error in fetching data from VectorDB")
+        if RERANKER is not None:
+            results = await asyncio.to_thread(self.rerank, query, results, started, certainty)
+
+        pieces = []
+        async for piece in self.astream_completion(self.answer_prompt(query, results, certainty, history = history), llm):
+            if not pieces:
+                print(f"Time to first token: {(time.perf_counter() - started) * 1000:.0f}ms")
+            pieces.append(piece)
+            yield piece
+        self.remember(cache_key, "".join(pieces))
+    
+    async def agenerate(self, query, api_key = None, certainty = None, filters = None):
+        """Answer a new search: retrieval over the pooled async vector-store client and a non-blocking LLM call."""
+        started = time.perf_counter()
+        llm = llm_client(api_key)
+        certainty = settings.RETRIEVAL_CERTAINTY if certainty is None else certainty
+        try:
+            answer, cache_key = await asyncio.to_thread(self.cached, query, certainty, filters)
+            if answer is not None:
                 return {"error":False, "message":answer}
+            results = await timed("Retrieval", self.afetch(query, certainty = certainty, filters = filters), settings.RETRIEVAL_TIMEOUT_SECONDS)
+            if results is None:
+                return {"error":True, "message":"Error in fetching data from VectorDB"}
+            if RERANKER is not None:
+                results = await asyncio.to_thread(self.rerank, query, results, started, certainty)
+            answer = await timed("Answer generation", self.acomplete(self.answer_prompt(query, results, certainty), llm), settings.ANSWER_TIMEOUT_SECONDS)
+            self.remember(cache_key, answer)
+            return {"error":False, "message":answer}
         except Exception as e:
             return {"error":True, "message":str(e)}
     
-    def continuous_response(self, query, message_history, threshold = 10, api_key = None):
-        if api_key is not None:
-            self.llm = ChatOpenAI(api_key = api_key, model = "gpt-3.5-turbo", temperature = 0)
+    async def acontinuous_response(self, query, message_history, threshold = 10, api_key = None, certainty = None, filters = None, summary = None):
+        started = time.perf_counter()
+        llm = llm_client(api_key)
+        certainty = settings.RETRIEVAL_CERTAINTY if certainty is None else certainty
         try:
-            history = ""
-            if len(message_history) > threshold:
-                message_history = message_history[-threshold:]
-            for message in  message_history:
-                history = history + message['role'] + ": " + message['content'] + "\n"
-
-            results = self.fetch(history)
-            if not results:
+            history = history_text(message_history, threshold, summary)
+            results = await timed("Retrieval", self.afetch(history, certainty = certainty, filters = filters), settings.RETRIEVAL_TIMEOUT_SECONDS)
+            if results is None:
                 return {"error":True, "message":"Error in fetching data from VectorDB"}
-            
-            if environment == "test":
-                if self.model is None and self.tokenizer is None:
-                    raise ValueError("Model and tokenizer must be provided")
-                context = "You must answer the asked Query based on Chat History and Provided Context to you. I will first provide with the Chat History, the the Context and finally the Query. Use the provided data to answer the finally asked Query"
-                context = context + "\n" + "Chat History:\n" + history            
-                cont_num = 0
-                for ind, res in enumerate(results):
-                    if res['_additional']['certainty'] >= 0.9:
-                        context = context + f"{cont_num + 1}) " + res['text'] + '\n'
-                        context = context + "Source: " + res['source'] + "\n"
-                        context = context + "Title of Paper: " + res['title'] + "\n"
-                        context = context + "Authors: " + ', '.join(auth for auth in res['authors']) + "\n"
-                        cont_num += 1
-                context = context + "\n" + "Query:\n" + query
-                context = context + "\n" + "Provide citations from the context you generated your answer in MLA Format"
-                inputs = self.tokenizer(context, return_tensors = "pt", padding = 'max_length', truncation = False)
-                device = torch.device("mps")
-                inputs = {k:v.to(device) for k,v in inputs.items()}
-                output = self.model.generate(input_ids = inputs['input_ids'],
-                attention_mask = inputs['attention_mask'], 
-                num_beams = 1,
-                top_p = 0.95,
-                max_new_tokens = 200,
-                do_sample = True
-                )
-                response = self.tokenizer.decode(output[0], skip_special_tokens=True)
-                return {"error":False, "message":response}
-            else:
-                prompt = "You are a Helpful Research Assisting Agent, tasked with generating a response to the query using data and context provided to you, as well as our previous Chat Historyand create MLA Citations for your answers. I will provide you with the context, certain amount of chat history and finally the query you need to answer."
-                message = "Context: \n"
-                cont_num = 0
-                for ind, res in enumerate(results):
-                    if res['_additional']['certainty'] >= 0.9:
-                        message = message + f"{cont_num + 1}) " + res['text'] + '\n'
-                        message = message + "Source: " + res['source'] + "\n"
-                        message = message + "Title of Paper: " + res['title'] + "\n"
-                        message = message + "Authors: " + ', '.join(auth for auth in res['authors']) + "\n"
-                        cont_num += 1
-                message = message + "\n" + "Chat History:\n" + history
-                message = message + "\n" + "Query:\n" + query
-                messages = [{"role":"system", "content":prompt}, {"role":"user", "content":message}]
-                response = self.llm.invoke(messages)
-                content = response.json()
-                answer = json.loads(content)['content']
-                return {"error":False, "message":answer}
+            if RERANKER is not None:
+                results = await asyncio.to_thread(self.rerank, query, results, started, certainty)
+            answer = await timed("Answer generation", self.acomplete(self.answer_prompt(query, results, certainty, history = history), llm), settings.ANSWER_TIMEOUT_SECONDS)
+            return {"error":False, "message":answer}
         except Exception as e:
             return {"error":True, "message":str(e)}
 
+    def summarize(self, summary, messages, api_key = None):
+        """Fold `messages` into the rolling chat `summary` and return the new summary."""
+        conversation = history_text(messages, len(messages))
+        instruction = "Update the summary of a research conversation with the new messages below. Keep the questions asked, the facts and papers cited in the answers, and any open threads. Reply with the summary only, in at most 200 words."
+        context = "Current summary:\n" + (summary or "(none)") + "\n" + "New messages:\n" + conversation
+        if environment == "test":
+            return self.run_local(instruction + "\n" + context)
+        return self.complete([{"role":"system", "content":instruction}, {"role":"user", "content":context}], llm_client(api_key))
+
+    async def abatch(self, queries, api_key = None, certainty = None, filters = None, answer = False, concurrency = None):
+        """Retrieve for many queries in one pass and optionally answer each, at most `concurrency` LLM calls at a time."""
+        certainty = settings.RETRIEVAL_CERTAINTY if certainty is None else certainty
+        try:
+            batch_hits = await self.vectordb.abatch_retrieve(queries, certainty = certainty, filters = filters)
+        except Exception as e:
+            print(e)
+            return {"error":True, "message":"Error in fetching data from VectorDB"}
+        results = [{"query":query, "hits":hits} for query, hits in zip(queries, batch_hits)]
+        if not answer:
+            return {"error":False, "results":results}
+
+        llm = llm_client(api_key)
+        semaphore = asyncio.Semaphore(concurrency or settings.BATCH_ANSWER_CONCURRENCY)
+
+        async def answer_one(result):
+            async with semaphore:
+                try:
+                    result["answer"] = await self.acomplete(self.answer_prompt(result["query"], result["hits"], certainty), llm)
+                except Exception as e:
+                    result["error"] = str(e)
+
+        await asyncio.gather(*(answer_one(result) for result in results))
+        return {"error":False, "results":results}
+
 TITLE_GENERATOR = TitleCreator(None, None)
-ANSWER_CREATOR = AnswerFetcher(None, None, weaviate_client)
+ANSWER_CREATOR = AnswerFetcher(None, None, vector_store)
     
     
+
+
+def fallback_title(query, length = 60):
+    query = query.replace("query: ", "").strip()
+    return query if len(query) <= length else query[:length].rsplit(" ", 1)[0] + "..."
+
+
+async def title_or_fallback(query, api_key = None):
+    """Generated title for a search, or a shortened query if generation fails or times out."""
+    try:
+        title = await timed("Title generation", TITLE_GENERATOR.atitle(query, api_key = api_key), settings.TITLE_TIMEOUT_SECONDS)
+    except TimeoutError as e:
+        title = {"error":True, "message":str(e)}
+    if title['error']:
+        print(f"Using the query as title: {title['message']}")
+        return fallback_title(query)
+    return title['title']
+
+
+async def asearch(query, api_key = None, certainty = None, filters = None):
+    """Title and answer for a new search, produced concurrently.
+
+    Title generation runs alongside retrieval and answering, so the latency is that of the
+    slower of the two rather than their sum. A failed answer cancels the title; a failed
+    title only falls back to the query text.
+    """
+    title_task = asyncio.create_task(title_or_fallback(query, api_key = api_key))
+    try:
+        answer = await ANSWER_CREATOR.agenerate(query, api_key = api_key, certainty = certainty, filters = filters)
+        if answer['error']:
+            return answer
+        return {"error":False, "title":await title_task, "message":answer['message']}
+    finally:
+        # Also reached when the request itself is cancelled, e.g. by a client disconnect
+        if not title_task.done():
+            title_task.cancel()
@@ -0,0 +1,80 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from app.core.config import settings
+
+
+class LLMPool(object):
+    """Bounded LRU of ChatOpenAI clients, one per API key, sharing keep-alive HTTP pools.
+
+    Clients are keyed by a SHA-256 of the key so raw keys are never used as dict keys or
+    logged. Every client sends through the same httpx.Client / httpx.AsyncClient, so
+    requests for different users reuse open connections to the API. ChatOpenAI is
+    stateless per call, which makes a pooled client safe to share between requests.
+    """
+    def __init__(self, max_clients = 256, model = "gpt-3.5-turbo", temperature = 0, base_url = None):
+        self.max_clients = max_clients
+        self.model = model
+        self.temperature = temperature
+        self.base_url = base_url or None
+        self.hits = 0
+        self.misses = 0
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        limits = httpx.Limits(
+            max_connections = settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections = settings.LLM_KEEPALIVE_CONNECTIONS
+        )
+        self.http_client = httpx.Client(limits = limits, timeout = settings.LLM_TIMEOUT_SECONDS)
+        self.http_async_client = httpx.AsyncClient(limits = limits, timeout = settings.LLM_TIMEOUT_SECONDS)
+
+    @staticmethod
+    def key(api_key):
+        return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+    def get(self, api_key):
+        key = self.key(api_key)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return client
+            self.misses += 1
+        client = ChatOpenAI(
+            api_key = api_key,
+            model = self.model,
+            temperature = self.temperature,
+            base_url = self.base_url,
+            http_client = self.http_client,
+            http_async_client = self.http_async_client
+        )
+        with self._lock:
+            # Another request may have built one for the same key meanwhile; either is fine
+            client = self._clients.setdefault(key, client)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last = False)
+        return client
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "clients": len(self._clients),
+                "max_clients": self.max_clients
+            }
+
+    async def aclose(self):
+        await self.http_async_client.aclose()
+        self.http_client.close()
+
+
+LLM_POOL = LLMPool(settings.LLM_POOL_SIZE, base_url = settings.OPENAI_BASE_URL)
@@ -0,0 +1,354 @@
+import fcntl
+import glob
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from app.helpers.vectorstore import VectorStore, matches, chunk_properties
+from app.helpers.keyword_index import BM25Index
+
+
+def project(row, properties):
+    if not properties:
+        return dict(row)
+    return {name: row[name] for name in properties if name in row}
+
+
+class NumpyVectorStore(VectorStore):
+    """Embedded vector store: a memory-mapped matrix of unit vectors plus row metadata.
+
+    Layout of `directory`:
+      vectors.bin  raw float32/float16 rows, one per chunk
+      rows.jsonl   one JSON object of chunk properties per row, in the same order
+      meta.json    {"dim", "dtype", "generation"}
+      store.lock   flock()ed by writers (exclusive) and by readers reloading (shared)
+    Top-k is one matrix-vector product over the whole matrix. Appends extend both files;
+    deletes write the kept rows to a new generation (vectors.<n>.bin, rows.<n>.jsonl) and
+    then swap meta.json to name it. That swap is the only commit point, so a crash leaves
+    either the old pair or the new pair, never one file of each. A BM25 index over the row
+    texts is kept in memory for keyword and hybrid retrieval.
+
+    Several processes may share `directory` (the API and `python -m app.worker`). Every
+    read and write first checks the size, mtime and inode of meta.json and both files and
+    reloads them when another process has changed them, which also bumps `corpus_version`.
+    """
+    def __init__(self, directory, dtype = "float32", limit = 20):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.limit = limit
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok = True)
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._lock_path = os.path.join(directory, "store.lock")
+        self._version = 0
+        self.dim = None
+        self.generation = 0
+        with self._file_lock(fcntl.LOCK_EX):
+            self._read_meta()
+            self._remove_stale_generations()
+            self.rows, ends = self._read_rows()
+            self._repair(ends)
+            self._remap()
+            self._index_rows()
+            self._signature = self._file_signature()
+
+    @contextmanager
+    def _file_lock(self, mode):
+        """Hold flock(`mode`) on store.lock, serialising this store's files across processes."""
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f.fileno(), mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _generation_paths(self, generation):
+        if generation == 0:
+            return os.path.join(self.directory, "vectors.bin"), os.path.join(self.directory, "rows.jsonl")
+        return (os.path.join(self.directory, f"vectors.{generation}.bin"),
+                os.path.join(self.directory, f"rows.{generation}.jsonl"))
+
+    @property
+    def _vectors_path(self):
+        return self._generation_paths(self.generation)[0]
+
+    @property
+    def _rows_path(self):
+        return self._generation_paths(self.generation)[1]
+
+    def _remove_stale_generations(self):
+        """Delete files of generations other than the current one: leftovers of a delete that crashed, or was superseded."""
+        current = set(self._generation_paths(self.generation))
+        for pattern in ("vectors*.bin", "rows*.jsonl", "*.tmp"):
+            for path in glob.glob(os.path.join(self.directory, pattern)):
+                if path not in current:
+                    os.remove(path)
+
+    def _file_signature(self):
+        signature = []
+        for path in (self._meta_path, self._vectors_path, self._rows_path):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _refresh(self, locked = False):
+        """Reload rows and re-map vectors if another process changed the files.
+
+        Call with self._lock held; pass `locked` when store.lock is already held exclusively.
+        """
+        if self._file_signature() == self._signature:
+            return
+        if not locked:
+            with self._file_lock(fcntl.LOCK_SH):
+                return self._refresh(locked = True)
+        self._read_meta()
+        self.rows, _ = self._read_rows()
+        self._remap()
+        self._index_rows()
+        self._signature = self._file_signature()
+        self._version += 1
+
+    @property
+    def corpus_version(self):
+        with self._lock:
+            self._refresh()
+            return self._version
+
+    def bump_corpus_version(self):
+        with self._lock:
+            self._version += 1
+
+    def _read_meta(self):
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+            # Stores written before deletes were generation-numbered use the plain file names
+            self.generation = meta.get("generation", 0)
+
+    def _write_meta(self, generation):
+        """Atomically replace meta.json; naming a new generation here is what commits a delete."""
+        meta = {"dim": self.dim, "dtype": self.dtype.name, "generation": generation}
+        self._write_file(self._meta_path, json.dumps(meta).encode("utf-8"))
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self.generation = generation
+
+    def _read_rows(self):
+        """Rows of rows.jsonl and the byte offset where each one ends."""
+        rows, ends = [], []
+        if not os.path.exists(self._rows_path):
+            return rows, ends
+        offset = 0
+        with open(self._rows_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # A crash mid-append leaves a partial last line
+                    break
+                offset += len(line)
+                if line.strip():
+                    rows.append(json.loads(line))
+                    ends.append(offset)
+        return rows, ends
+
+    @staticmethod
+    def _truncate(path, size):
+        with open(path, "r+b") as f:
+            f.truncate(size)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _repair(self, ends):
+        """Cut vectors.bin and rows.jsonl on disk back to the rows both of them hold.
+
+        A crash between the two appends of write_chunks leaves the files out of step (deletes
+        cannot: they commit through meta.json, see delete_rows).
+        Only trimming the in-memory copy would let the next append write past the stale
+        tail and misalign every later row, so the longer file is truncated here.
+        """
+        if self.dim is None:
+            return
+        row_bytes = self.dim * self.dtype.itemsize
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        count = min(size // row_bytes, len(self.rows))
+        if size != count * row_bytes:
+            print(f"Truncating {self._vectors_path} from {size // row_bytes} to {count} rows")
+            self._truncate(self._vectors_path, count * row_bytes)
+        end = ends[count - 1] if count else 0
+        if os.path.exists(self._rows_path) and os.path.getsize(self._rows_path) != end:
+            print(f"Truncating {self._rows_path} to {count} complete rows")
+            self._truncate(self._rows_path, end)
+            self.rows = self.rows[:count]
+
+    @staticmethod
+    def _write_file(path, data):
+        """Replace `path` with `data` through a synced temp file, so readers see the old or the new file whole."""
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _index_rows(self):
+        # Row numbers change when rows are deleted, so the keyword index is rebuilt then
+        self.keywords = BM25Index()
+        for index, row in enumerate(self.rows):
+            self.keywords.add(index, row["text"])
+
+    def _remap(self):
+        count = len(self.rows)
+        if self.dim is None or count == 0 or not os.path.exists(self._vectors_path):
+            self.matrix = np.zeros((0, self.dim or 0), dtype = self.dtype)
+            return
+        stored = os.path.getsize(self._vectors_path) // (self.dim * self.dtype.itemsize)
+        if stored < count:
+            # _repair keeps the files in step; this only guards the memmap shape
+            count = stored
+            self.rows = self.rows[:count]
+        self.matrix = np.memmap(self._vectors_path, dtype = self.dtype, mode = "r", shape = (count, self.dim))
+
+    def upload_file(self, chunks):
+        from app.helpers.weaviate import embed_texts
+        vectors = embed_texts([chunk["text"] for chunk in chunks])
+        self.write_chunks(chunks, vectors)
+
+    def write_chunks(self, chunks, vectors):
+        if not chunks:
+            print("No chunks to upload")
+            return
+        matrix = np.asarray(vectors, dtype = np.float32)
+        matrix = matrix / np.clip(np.linalg.norm(matrix, axis = 1, keepdims = True), 1e-12, None)
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            # Row numbers continue from whatever other processes have appended
+            self._refresh(locked = True)
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self._write_meta(self.generation)
+            # Vectors first and synced, so after a crash rows.jsonl is never the longer file
+            with open(self._vectors_path, "ab") as f:
+                f.write(matrix.astype(self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._rows_path, "a") as f:
+                for chunk in chunks:
+                    f.write(json.dumps(chunk_properties(chunk)) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            first = len(self.rows)
+            self.rows.extend(chunk_properties(chunk) for chunk in chunks)
+            self._remap()
+            for index in range(first, len(self.rows)):
+                self.keywords.add(index, self.rows[index]["text"])
+            self._signature = self._file_signature()
+        self.bump_corpus_version()
+        print(f"Successfully stored {len(chunks)} chunks in the local vector store")
+
+    def snapshot(self):
+        """Matrix and rows that belong together, safe to read while writers append or delete."""
+        with self._lock:
+            self._refresh()
+            return self.matrix, self.rows
+
+    def filter_mask(self, rows, filters):
+        """Boolean mask of the rows that satisfy `filters`, or None when there are no filters."""
+        if not filters or not any(value is not None for value in filters.values()):
+            return None
+        return np.fromiter((matches(row, filters) for row in rows), dtype = bool, count = len(rows))
+
+    def search(self, query_vector, limit = None, matrix = None, mask = None):
+        """Return (row index, cosine) pairs of the top `limit` rows (among `mask`, if given) for a query vector."""
+        matrix = self.matrix if matrix is None else matrix
+        candidates = len(matrix) if mask is None else int(mask[:len(matrix)].sum())
+        if candidates == 0:
+            return []
+        limit = min(limit or self.limit, candidates)
+        query_vector = np.asarray(query_vector, dtype = np.float32)
+        query_vector = query_vector / max(np.linalg.norm(query_vector), 1e-12)
+        scores = np.asarray(matrix @ query_vector.astype(self.dtype), dtype = np.float32)
+        if mask is not None:
+            scores[~mask[:len(matrix)]] = -np.inf
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(int(index), float(scores[index])) for index in top]
+
+    def vector_search(self, query_vector, limit, certainty = None, properties = None, filters = None):
+        matrix, rows = self.snapshot()
+        mask = self.filter_mask(rows[:len(matrix)], filters)
+        # certainty = (1 + cosine) / 2, so the cutoff becomes a minimum cosine
+        min_cosine = None if certainty is None else 2 * certainty - 1
+        results = []
+        for index, cosine in self.search(query_vector, limit = limit, matrix = matrix, mask = mask):
+            if min_cosine is not None and cosine < min_cosine:
+                break
+            hit = project(rows[index], properties)
+            # Same scale as Weaviate's certainty for cosine distance
+            hit["_additional"] = {"certainty": (1 + cosine) / 2}
+            results.append(hit)
+        return results
+
+    def keyword_search(self, query, limit, properties = None, filters = None):
+        with self._lock:
+            self._refresh()
+            rows = self.rows
+            mask = self.filter_mask(rows, filters)
+            allowed = None if mask is None else set(np.flatnonzero(mask).tolist())
+            ranked = self.keywords.search(query, limit = limit, allowed = allowed)
+        results = []
+        for index, score in ranked:
+            hit = project(rows[index], properties)
+            hit["_additional"] = {"score": score}
+            results.append(hit)
+        return results
+
+    def delete(self, title:str):
+        return self.delete_rows(lambda row: row["title"] == title)
+
+    def delete_document(self, document_id, title):
+        return self.delete_rows(lambda row: row.get("document_id") == document_id)
+
+    def delete_rows(self, predicate):
+        try:
+            with self._lock, self._file_lock(fcntl.LOCK_EX):
+                self._refresh(locked = True)
+                keep = [index for index, row in enumerate(self.rows) if not predicate(row)]
+                removed = len(self.rows) - len(keep)
+                if removed == 0:
+                    return {
+                        "success":False,
+                        "message":"Could not find any items in Vector Store"
+                    }
+                kept_vectors = np.array(self.matrix[keep], dtype = self.dtype)
+                kept_rows = [self.rows[index] for index in keep]
+                # Both files of the next generation are synced before meta.json points at them;
+                # until that swap a crash leaves the current generation untouched
+                generation = self.generation + 1
+                vectors_path, rows_path = self._generation_paths(generation)
+                self._write_file(vectors_path, kept_vectors.tobytes())
+                self._write_file(rows_path, "".join(json.dumps(row) + "\n" for row in kept_rows).encode("utf-8"))
+                self.matrix = np.zeros((0, self.dim), dtype = self.dtype)
+                self._write_meta(generation)
+                self._remove_stale_generations()
+                self.rows = kept_rows
+                self._remap()
+                self._index_rows()
+                self._signature = self._file_signature()
+            self.bump_corpus_version()
+            return {
+                "success":True,
+                "message":f"Deleted {removed} items from the Vector Store",
+            }
+        except Exception as e:
+            return {
+                "success":False,
+                "message":f"{e}: Error encountered in deleting from Vector Store"
+            }
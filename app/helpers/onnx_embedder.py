@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import onnxruntime as ort
+from transformers import AutoTokenizer
+
+
+def export_onnx(model_name, model_dir, quantize = False):
+    """Export a Hugging Face encoder to ONNX (optionally int8-quantized) and return the model path.
+
+    The export is skipped when the file already exists, so this only costs time on first start.
+    """
+    os.makedirs(model_dir, exist_ok = True)
+    onnx_path = os.path.join(model_dir, "model.onnx")
+    if not os.path.exists(onnx_path):
+        import torch
+        from transformers import AutoModel
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name)
+        model.eval()
+        sample = tokenizer(["query: export"], return_tensors = "pt")
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                (sample["input_ids"], sample["attention_mask"]),
+                onnx_path,
+                input_names = ["input_ids", "attention_mask"],
+                output_names = ["last_hidden_state"],
+                dynamic_axes = {
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "last_hidden_state": {0: "batch", 1: "sequence"}
+                },
+                opset_version = 14
+            )
+        tokenizer.save_pretrained(model_dir)
+        print(f"Exported {model_name} to {onnx_path}")
+
+    if not quantize:
+        return onnx_path
+
+    quantized_path = os.path.join(model_dir, "model.int8.onnx")
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(onnx_path, quantized_path, weight_type = QuantType.QInt8)
+        print(f"Quantized {onnx_path} to {quantized_path}")
+    return quantized_path
+
+
+class OnnxEmbedder(object):
+    """Mean-pooled sentence embeddings from an ONNX export, with the SentenceTransformer.encode interface."""
+    def __init__(self, model_name, model_dir, quantize = False, threads = 0, max_length = 512):
+        self.model_name = model_name
+        self.max_length = max_length
+        model_path = export_onnx(model_name, model_dir, quantize = quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, sess_options = options, providers = ["CPUExecutionProvider"])
+
+    def encode(self, sentences, batch_size = 32, normalize_embeddings = False, show_progress_bar = False, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        outputs = []
+        for start in range(0, len(sentences), batch_size):
+            batch = sentences[start:start + batch_size]
+            tokens = self.tokenizer(batch, padding = True, truncation = True, max_length = self.max_length, return_tensors = "np")
+            mask = tokens["attention_mask"].astype(np.int64)
+            hidden = self.session.run(None, {
+                "input_ids": tokens["input_ids"].astype(np.int64),
+                "attention_mask": mask
+            })[0]
+            weights = mask[:, :, None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis = 1) / np.clip(weights.sum(axis = 1), 1e-9, None)
+            if normalize_embeddings:
+                pooled = pooled / np.clip(np.linalg.norm(pooled, axis = 1, keepdims = True), 1e-12, None)
+            outputs.append(pooled.astype(np.float32))
+        embeddings = np.concatenate(outputs, axis = 0) if outputs else np.zeros((0, 0), dtype = np.float32)
+        return embeddings[0] if single else embeddings
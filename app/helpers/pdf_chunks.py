@@ -0,0 +1,81 @@
+"""PDF parsing into sliding-window chunks.
+
+These functions run inside parse-pool worker processes, so this module imports nothing
+beyond PyMuPDF and the standard library: importing it must never load the embedding
+model or open the caches that app.helpers.weaviate sets up at import time.
+"""
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pymupdf as fitz
+
+
+def parse_pool(workers):
+    """Process pool for the parse functions below.
+
+    Workers are forked from a forkserver that has imported only this module, so they neither
+    re-load the embedding model nor inherit the threads of the (torch, multi-threaded)
+    process that asks for the pool. Where forkserver is unavailable they are spawned.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers = workers, mp_context = context)
+
+
+def page_chunks(page, page_num, document_name, authors_list, file_link, metadata = None):
+    blocks = page.get_text("blocks")
+    full_text = ""
+    for block in blocks:
+        block_text = block[4]
+        block_type = block[6] if len(block)>6 else 0
+        if block_type == 0:
+            full_text = full_text + block_text + "\n"
+        else:
+            continue
+    
+    full_text = full_text.replace("\n", " ")
+    full_text = full_text.replace("- ", "")
+    sentences = re.split(r'(?<=[.?!])\s+', full_text)
+
+    documents = []
+    for start in range(len(sentences) - 2):
+        chunk = ' '.join(sent for sent in sentences[start:start+3])
+        documents.append({
+            "text" : chunk,
+            # Kept for the compact layout, which stores each sentence once in the sentence store
+            "sentence": start,
+            "sentences": sentences[start:start+3],
+            "paper-name": document_name,
+            "authors": authors_list,
+            "metadata" : {
+                "page": str(page_num + 1),
+                "source": file_link,
+                **(metadata or {})
+            }
+        })
+    return documents
+
+def load_page_range(file_name, first_page, last_page, document_name, authors_list, file_link, metadata = None):
+    """Chunk pages [first_page, last_page) of a PDF into one list per page. Runs inside pool workers, so it opens its own handle."""
+    doc = fitz.open(file_name)
+    try:
+        return [page_chunks(doc[page_num], page_num, document_name, authors_list, file_link, metadata) for page_num in range(first_page, last_page)]
+    finally:
+        doc.close()
+
+def load_file(file_name, document_name, authors_list, file_link, metadata = None):
+    """Chunk a whole PDF inside a pool worker, returning (chunks, page_count, seconds)."""
+    start = time.perf_counter()
+    doc = fitz.open(file_name)
+    try:
+        documents = []
+        for page_num, page in enumerate(doc):
+            documents.extend(page_chunks(page, page_num, document_name, authors_list, file_link, metadata))
+        return documents, doc.page_count, time.perf_counter() - start
+    finally:
+        doc.close()
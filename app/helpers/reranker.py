@@ -0,0 +1,79 @@
+import threading
+import time
+
+from app.core.config import settings
+
+
+class Reranker(object):
+    """Cross-encoder reranking of retrieved hits under a per-request latency budget.
+
+    The model is loaded on first use. A running average of the per-pair scoring cost is
+    kept so reranking can be skipped up front when it would not fit in the time left, and
+    it stops between batches once the deadline passes. Skipped or partial reranks return
+    the hits in their original retrieval order.
+    """
+    def __init__(self, model_name, batch_size = 16, top_n = 5, budget_ms = 300):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.top_n = top_n
+        self.budget_ms = budget_ms
+        self.pair_seconds = None
+        self.skipped = 0
+        self.reranked = 0
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+                self._model = CrossEncoder(self.model_name)
+            return self._model
+
+    def rerank(self, query, hits, started = None, top_n = None):
+        """Return the best `top_n` hits for `query`; `started` is the request's perf_counter start time."""
+        top_n = top_n or self.top_n
+        if len(hits) <= 1:
+            return hits
+        started = time.perf_counter() if started is None else started
+        deadline = started + self.budget_ms / 1000
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0 or (self.pair_seconds is not None and self.pair_seconds * len(hits) > remaining):
+            self.skipped += 1
+            return hits
+
+        scores = []
+        for start in range(0, len(hits), self.batch_size):
+            if time.perf_counter() > deadline:
+                self.skipped += 1
+                return hits
+            batch = hits[start:start + self.batch_size]
+            batch_start = time.perf_counter()
+            scores.extend(self.model.predict([(query, hit["text"]) for hit in batch], show_progress_bar = False))
+            cost = (time.perf_counter() - batch_start) / len(batch)
+            self.pair_seconds = cost if self.pair_seconds is None else 0.8 * self.pair_seconds + 0.2 * cost
+
+        self.reranked += 1
+        order = sorted(range(len(hits)), key = lambda index: scores[index], reverse = True)[:top_n]
+        reranked = []
+        for index in order:
+            hit = dict(hits[index])
+            hit["_additional"] = dict(hit.get("_additional") or {}, rerank_score = float(scores[index]))
+            reranked.append(hit)
+        return reranked
+
+    def stats(self):
+        return {
+            "reranked": self.reranked,
+            "skipped": self.skipped,
+            "pair_ms": round(self.pair_seconds * 1000, 3) if self.pair_seconds is not None else None
+        }
+
+
+RERANKER = Reranker(
+    settings.RERANKER_MODEL,
+    batch_size = settings.RERANK_BATCH_SIZE,
+    top_n = settings.RERANK_TOP_N,
+    budget_ms = settings.RERANK_BUDGET_MS
+) if settings.RERANKER_ENABLED else None
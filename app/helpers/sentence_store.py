@@ -0,0 +1,96 @@
+import json
+import sqlite3
+import threading
+
+from app.core.config import settings
+
+# Sentences per chunk window, as produced by page_chunks
+CHUNK_SENTENCES = 3
+
+
+class SentenceStore(object):
+    """Local SQLite store of document metadata and page sentences for the compact chunk layout.
+
+    In the compact layout a vector-store object holds only its vector, title, page and the
+    index of its first sentence; each sentence and each document's source and authors are
+    stored once here, and hits are given back their text, source and authors at read time.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread = False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS documents (title TEXT PRIMARY KEY, source TEXT, authors TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sentences (title TEXT NOT NULL, page TEXT NOT NULL, position INTEGER NOT NULL, "
+            "text TEXT NOT NULL, PRIMARY KEY (title, page, position))"
+        )
+        self._conn.commit()
+
+    def add_chunks(self, chunks):
+        """Record the documents and sentences behind PDFLoader chunks (which carry "sentence" and "sentences")."""
+        documents = {}
+        sentences = []
+        for chunk in chunks:
+            documents[chunk["paper-name"]] = (chunk["metadata"]["source"], json.dumps(chunk["authors"]))
+            for offset, text in enumerate(chunk["sentences"]):
+                sentences.append((chunk["paper-name"], chunk["metadata"]["page"], chunk["sentence"] + offset, text))
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (title, source, authors) VALUES (?, ?, ?)",
+                [(title, source, authors) for title, (source, authors) in documents.items()]
+            )
+            self._conn.executemany("INSERT OR IGNORE INTO sentences (title, page, position, text) VALUES (?, ?, ?, ?)", sentences)
+            self._conn.commit()
+
+    def hydrate(self, hits):
+        """Fill in text, source and authors of compact hits in place. Hits that already have text are left alone.
+
+        Returns the hits that could be hydrated. A compact hit whose document row or sentences
+        are missing (e.g. a store written before the sentence store existed) is dropped with a
+        warning rather than passed on without text or source.
+        """
+        compact = [hit for hit in hits if hit.get("text") is None and hit.get("sentence") is not None]
+        if not compact:
+            return hits
+        ranges = {}
+        for hit in compact:
+            first, last = ranges.get((hit["title"], hit["page"]), (hit["sentence"], hit["sentence"]))
+            ranges[(hit["title"], hit["page"])] = (min(first, hit["sentence"]), max(last, hit["sentence"]))
+        with self._lock:
+            pages = {}
+            for (title, page), (first, last) in ranges.items():
+                rows = self._conn.execute(
+                    "SELECT position, text FROM sentences WHERE title = ? AND page = ? AND position BETWEEN ? AND ?",
+                    (title, page, first, last + CHUNK_SENTENCES - 1)
+                ).fetchall()
+                pages[(title, page)] = dict(rows)
+            titles = list({hit["title"] for hit in compact})
+            documents = {
+                title: (source, json.loads(authors))
+                for title, source, authors in self._conn.execute(
+                    f"SELECT title, source, authors FROM documents WHERE title IN ({','.join('?' * len(titles))})", titles
+                ).fetchall()
+            }
+        missing = set()
+        for hit in compact:
+            page = pages[(hit["title"], hit["page"])]
+            text = " ".join(page[position] for position in range(hit["sentence"], hit["sentence"] + CHUNK_SENTENCES) if position in page)
+            if not text or hit["title"] not in documents:
+                missing.add(id(hit))
+                continue
+            hit["text"] = text
+            hit["source"], hit["authors"] = documents[hit["title"]]
+        if missing:
+            titles = sorted({hit["title"] for hit in compact if id(hit) in missing})
+            print(f"Warning: dropped {len(missing)} hits missing from the sentence store: {titles}")
+        return [hit for hit in hits if id(hit) not in missing]
+
+    def delete(self, title):
+        with self._lock:
+            self._conn.execute("DELETE FROM sentences WHERE title = ?", (title,))
+            self._conn.execute("DELETE FROM documents WHERE title = ?", (title,))
+            self._conn.commit()
+
+
+SENTENCE_STORE = SentenceStore(settings.SENTENCE_STORE_PATH) if settings.SENTENCE_STORE_PATH else None
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import uuid
+from contextlib import contextmanager
+
+import boto3
+
+from app.core.config import settings
+
+S3_SCHEME = "s3://"
+
+
+def s3_client():
+    return boto3.client(
+        "s3",
+        aws_access_key_id = settings.AWS_ACCESS_KEY,
+        aws_secret_access_key = settings.AWS_SECRET_KEY,
+        region_name = settings.AWS_REGION
+    )
+
+
+def split_s3(reference):
+    bucket, _, key = reference[len(S3_SCHEME):].partition("/")
+    return bucket, key
+
+
+def spool_file(local_path):
+    """Move an uploaded PDF into the ingest spool and return the reference stored on its IngestJob.
+
+    With INGEST_SPOOL_STORAGE=s3 the file goes to AWS_BUCKET_NAME under INGEST_SPOOL_PREFIX,
+    so any worker (another instance, or `python -m app.worker`) can fetch it and it survives
+    the instance being recycled. "local" keeps it under INGEST_SPOOL_DIR, which only works
+    when the workers share that disk.
+    """
+    name = f"{uuid.uuid4()}.pdf"
+    if settings.INGEST_SPOOL_STORAGE == "s3":
+        key = f"{settings.INGEST_SPOOL_PREFIX}{name}"
+        s3_client().upload_file(local_path, settings.AWS_BUCKET_NAME, key)
+        os.remove(local_path)
+        return f"{S3_SCHEME}{settings.AWS_BUCKET_NAME}/{key}"
+    os.makedirs(settings.INGEST_SPOOL_DIR, exist_ok = True)
+    target = os.path.join(settings.INGEST_SPOOL_DIR, name)
+    shutil.move(local_path, target)
+    return target
+
+
+def spool_bytes(content):
+    fd, path = tempfile.mkstemp(suffix = ".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    try:
+        return spool_file(path)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@contextmanager
+def local_copy(reference):
+    """Yield a local path for a spooled file, downloading it first if it lives in S3."""
+    if not reference.startswith(S3_SCHEME):
+        if not os.path.exists(reference):
+            raise Exception(f"Spooled file not found: {reference}")
+        yield reference
+        return
+    bucket, key = split_s3(reference)
+    fd, path = tempfile.mkstemp(suffix = ".pdf")
+    os.close(fd)
+    try:
+        s3_client().download_file(bucket, key, path)
+        yield path
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def remove_spooled(reference):
+    if not reference:
+        return
+    try:
+        if reference.startswith(S3_SCHEME):
+            bucket, key = split_s3(reference)
+            s3_client().delete_object(Bucket = bucket, Key = key)
+        elif os.path.exists(reference):
+            os.remove(reference)
+    except Exception as cleanup_error:
+        print(f"Warning: Could not delete spooled file: {cleanup_error}")
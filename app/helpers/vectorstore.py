@@ -0,0 +1,238 @@
+import asyncio
+import time
+
+from app.core.config import settings
+from app.helpers.keyword_index import reciprocal_rank_fusion
+
+
+FULL_PROPERTIES = ["text", "source", "page", "title", "authors", "document_id", "subject"]
+# What the prompt builders in llm.py actually read
+PROMPT_PROPERTIES = ["text", "source", "title", "authors"]
+
+
+def matches(row, filters):
+    """Whether a stored row satisfies retrieval filters, for backends that filter in Python."""
+    document_id = filters.get("document_id")
+    if isinstance(document_id, (list, tuple)):
+        if row.get("document_id") not in document_id:
+            return False
+    elif document_id is not None and row.get("document_id") != document_id:
+        return False
+    if filters.get("subject") and row.get("subject") != filters["subject"]:
+        return False
+    if filters.get("author") and filters["author"] not in (row.get("authors") or []):
+        return False
+    return True
+
+
+def hit_key(hit):
+    return (hit.get("source"), hit.get("page"), hit["text"])
+
+
+def chunk_properties(chunk):
+    """Stored properties of a PDFLoader chunk, shared by both backends."""
+    properties = {
+        "text": chunk["text"],
+        "source": chunk["metadata"]["source"],
+        "page": chunk["metadata"]["page"],
+        "title": chunk["paper-name"],
+        "authors": chunk["authors"]
+    }
+    # Filterable metadata, present for documents ingested through the API
+    for name in ("document_id", "subject"):
+        if chunk["metadata"].get(name) is not None:
+            properties[name] = chunk["metadata"][name]
+    return properties
+
+
+def keyword_score(hit):
+    # Weaviate returns the BM25 score as a string
+    return float((hit.get("_additional") or {}).get("score") or 0)
+
+
+class VectorStore(object):
+    """Interface shared by the vector-store backends.
+
+    Chunks are the dicts produced by PDFLoader; retrieve returns Weaviate-shaped hits
+    ({"text", "source", "page", "title", "authors", "_additional": {"certainty"}}) so the
+    callers in llm.py do not depend on the backend.
+
+    `corpus_version` is bumped by every write and delete so that caches of derived results
+    (answers in llm.py) can tell when they are stale. It only sees this process's writes;
+    changes made by the ingest workers are tracked by the shared counter in corpus_version.py.
+    """
+    corpus_version = 0
+
+    def bump_corpus_version(self):
+        self.corpus_version += 1
+
+    def ensure_schema(self):
+        pass
+
+    def upload_file(self, chunks):
+        raise NotImplementedError
+
+    def write_chunks(self, chunks, vectors):
+        raise NotImplementedError
+
+    def vector_search(self, query_vector, limit, certainty = None, properties = None, filters = None):
+        """Nearest neighbours of query_vector. Hits below `certainty` are dropped by the backend."""
+        raise NotImplementedError
+
+    def keyword_search(self, query, limit, properties = None, filters = None):
+        raise NotImplementedError
+
+    def delete(self, title):
+        raise NotImplementedError
+
+    def delete_document(self, document_id, title):
+        """Delete the chunks stored with `document_id`. Prefer this to delete(title) wherever the id is known."""
+        raise NotImplementedError
+
+    def retrieve(self, query, embedder = None, mode = None, limit = None, certainty = None, properties = None, filters = None):
+        results, timings = self.retrieve_with_timings(query, embedder = embedder, mode = mode, limit = limit,
+                                                      certainty = certainty, properties = properties, filters = filters)
+        return results
+
+    def retrieve_with_timings(self, query, embedder = None, mode = None, limit = None, certainty = None, properties = None, filters = None):
+        """Run the configured retrieval mode and return (hits, per-stage seconds).
+
+        "vector" is plain nearest-neighbour search. "hybrid" also runs keyword (BM25) search
+        and fuses both rankings by weighted reciprocal rank, so exact terms like gene names
+        or dataset ids are found even when their embeddings are not close to the query's.
+        `certainty`, `properties` and `filters` ({"document_id", "subject", "author"}) are
+        pushed down into the backend query so that hits the caller would discard are never
+        transferred.
+        """
+        from app.helpers.weaviate import embed_query, embedder as default_embedder
+        mode = mode or settings.RETRIEVAL_MODE
+        limit = limit or settings.RETRIEVAL_LIMIT
+        properties = properties or FULL_PROPERTIES
+        timings = {}
+
+        start = time.perf_counter()
+        query_vector = embed_query(query, embedder or default_embedder)
+        timings["embed"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        vector_hits = self.vector_search(query_vector, limit, certainty = certainty, properties = properties, filters = filters)
+        timings["vector"] = time.perf_counter() - start
+        if mode != "hybrid":
+            return vector_hits, timings
+
+        start = time.perf_counter()
+        keyword_hits = self.keyword_search(query, limit, properties = properties, filters = filters)
+        timings["keyword"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = self.fuse(vector_hits, keyword_hits, limit)
+        timings["fusion"] = time.perf_counter() - start
+        return results, timings
+
+    async def avector_search(self, query_vector, limit, certainty = None, properties = None, filters = None):
+        """Async vector_search; backends without a native async client run the sync one in a thread."""
+        return await asyncio.to_thread(self.vector_search, query_vector, limit, certainty, properties, filters)
+
+    async def akeyword_search(self, query, limit, properties = None, filters = None):
+        return await asyncio.to_thread(self.keyword_search, query, limit, properties, filters)
+
+    async def aretrieve_with_timings(self, query, embedder = None, mode = None, limit = None, certainty = None, properties = None, filters = None):
+        """Async retrieve_with_timings. In hybrid mode the vector and keyword searches run concurrently."""
+        from app.helpers.weaviate import embed_query, embedder as default_embedder
+        mode = mode or settings.RETRIEVAL_MODE
+        limit = limit or settings.RETRIEVAL_LIMIT
+        properties = properties or FULL_PROPERTIES
+        timings = {}
+
+        start = time.perf_counter()
+        query_vector = await asyncio.to_thread(embed_query, query, embedder or default_embedder)
+        timings["embed"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if mode != "hybrid":
+            vector_hits = await self.avector_search(query_vector, limit, certainty = certainty, properties = properties, filters = filters)
+            timings["vector"] = time.perf_counter() - start
+            return vector_hits, timings
+        vector_hits, keyword_hits = await asyncio.gather(
+            self.avector_search(query_vector, limit, certainty = certainty, properties = properties, filters = filters),
+            self.akeyword_search(query, limit, properties = properties, filters = filters)
+        )
+        timings["search"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = self.fuse(vector_hits, keyword_hits, limit)
+        timings["fusion"] = time.perf_counter() - start
+        return results, timings
+
+    async def abatch_vector_search(self, query_vectors, limit, certainty = None, properties = None, filters = None):
+        """Vector search for many query vectors, returning one hit list per vector."""
+        return await asyncio.gather(*(
+            self.avector_search(vector, limit, certainty = certainty, properties = properties, filters = filters)
+            for vector in query_vectors
+        ))
+
+    async def abatch_retrieve(self, queries, embedder = None, mode = None, limit = None, certainty = None, properties = None, filters = None):
+        """Retrieve for many queries at once: one batched encode, then concurrent lookups.
+
+        Returns one hit list per query, in the order given. The same mode, certainty and
+        filters apply to every query.
+        """
+        from app.helpers.weaviate import embed_queries, embedder as default_embedder
+        mode = mode or settings.RETRIEVAL_MODE
+        limit = limit or settings.RETRIEVAL_LIMIT
+        properties = properties or FULL_PROPERTIES
+        query_vectors = await asyncio.to_thread(embed_queries, queries, embedder or default_embedder)
+        vector_task = self.abatch_vector_search(query_vectors, limit, certainty = certainty, properties = properties, filters = filters)
+        if mode != "hybrid":
+            return await vector_task
+        vector_hits, keyword_hits = await asyncio.gather(
+            vector_task,
+            asyncio.gather(*(self.akeyword_search(query, limit, properties = properties, filters = filters) for query in queries))
+        )
+        return [self.fuse(vectors, keywords, limit) for vectors, keywords in zip(vector_hits, keyword_hits)]
+
+    def fuse(self, vector_hits, keyword_hits, limit):
+        # Keyword-only hits skip the certainty cutoff downstream, so weak term matches are dropped here
+        vector_keys = {hit_key(hit) for hit in vector_hits}
+        keyword_hits = [
+            hit for hit in keyword_hits
+            if hit_key(hit) in vector_keys or keyword_score(hit) >= settings.KEYWORD_MIN_SCORE
+        ]
+        fused = reciprocal_rank_fusion(
+            [[(hit_key(hit), hit) for hit in vector_hits], [(hit_key(hit), hit) for hit in keyword_hits]],
+            [settings.HYBRID_VECTOR_WEIGHT, settings.HYBRID_KEYWORD_WEIGHT],
+            k = settings.RRF_K
+        )
+        results = []
+        for key, hit, score in fused[:limit]:
+            hit = dict(hit)
+            hit["_additional"] = dict(hit.get("_additional") or {}, rrf_score = score)
+            results.append(hit)
+        return results
+
+    async def aclose(self):
+        pass
+
+    def delete(self, title:str):
+        raise NotImplementedError
+
+    def upload_folder(self, doc_directory, manifest, workers = None):
+        """Bulk-ingest every PDF in a directory described by a manifest.
+
+        The manifest is a list of {"file", "title", "authors", "link"} entries, or a dict
+        of the same entries keyed by file name. Returns the bulk_ingest report.
+        """
+        from app.helpers.ingest import bulk_ingest, manifest_entries
+        return bulk_ingest(self, manifest_entries(doc_directory, manifest), workers = workers)
+
+
+def get_vector_store(backend = None):
+    """Build the vector store selected by settings.VECTOR_STORE ("weaviate" or "numpy")."""
+    backend = backend or settings.VECTOR_STORE
+    if backend == "numpy":
+        from app.helpers.numpy_store import NumpyVectorStore
+        return NumpyVectorStore(settings.NUMPY_STORE_DIR, dtype = settings.NUMPY_STORE_DTYPE)
+    if backend == "weaviate":
+        from app.helpers.weaviate import WeaviateDB
+        return WeaviateDB(settings.WEAVIATE_URL)
+    raise ValueError(f"Unknown vector store backend: {backend}")
@@ -1,127 +1,470 @@
 import weaviate
+import asyncio
+import httpx
+import json
 from sentence_transformers import SentenceTransformer
 from langchain_community.document_loaders.pdf import BasePDFLoader
 import pymupdf as fitz
-import re
 import os
+from collections import deque
+from app.core.config import settings
+from app.helpers.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+from app.helpers.vectorstore import VectorStore, FULL_PROPERTIES, chunk_properties
+from app.helpers.sentence_store import SENTENCE_STORE
+from app.helpers.authors import document_ids_by_author
+from app.helpers.pdf_chunks import page_chunks, load_page_range, parse_pool
 
-embedder = SentenceTransformer("intfloat/e5-base")
+def load_embedder(backend = None):
+    """Build the embedding model for the configured backend ("torch" or "onnx")."""
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend == "onnx":
+        from app.helpers.onnx_embedder import OnnxEmbedder
+        return OnnxEmbedder(
+            settings.EMBEDDING_MODEL,
+            settings.ONNX_MODEL_DIR,
+            quantize = settings.ONNX_QUANTIZE,
+            threads = settings.ONNX_THREADS,
+            max_length = settings.EMBED_MAX_LENGTH
+        )
+    return SentenceTransformer(settings.EMBEDDING_MODEL)
 
-class WeaviateDB:
-    def __init__(self, url_link):
+embedder = load_embedder()
+# Identifies the vectors' origin in cache keys, since backends differ slightly numerically
+EMBEDDER_NAME = f"{settings.EMBEDDING_MODEL}:{settings.EMBEDDING_BACKEND}{'-int8' if settings.EMBEDDING_BACKEND == 'onnx' and settings.ONNX_QUANTIZE else ''}"
+
+embedding_cache = EmbeddingCache(
+    settings.EMBED_CACHE_PATH,
+    max_entries = settings.EMBED_CACHE_MAX_ENTRIES,
+    dtype = settings.EMBED_CACHE_DTYPE
+) if settings.EMBED_CACHE_PATH else None
+
+query_cache = QueryEmbeddingCache(settings.QUERY_CACHE_SIZE)
+
+def embed_query(query, embedder = embedder, model_name = None, cache = query_cache):
+    """Embed a search query, reusing the vector of an identical (whitespace/case-normalized) earlier query."""
+    if cache is None or cache.max_entries <= 0:
+        return embedder.encode(query)
+    key = cache.key(model_name or EMBEDDER_NAME, query)
+    vector = cache.get(key)
+    if vector is None:
+        vector = embedder.encode(query)
+        cache.put(key, vector)
+    return vector
+
+def embed_queries(queries, embedder = embedder, model_name = None, cache = query_cache):
+    """Embed many search queries, encoding every cache miss in a single batched call."""
+    use_cache = cache is not None and cache.max_entries > 0
+    keys = [cache.key(model_name or EMBEDDER_NAME, query) for query in queries] if use_cache else None
+    vectors = [cache.get(key) for key in keys] if use_cache else [None] * len(queries)
+    missing = [index for index, vector in enumerate(vectors) if vector is None]
+    if missing:
+        encoded = encode_sorted([queries[i] for i in missing], embedder, normalize = False)
+        for index, vector in zip(missing, encoded):
+            vectors[index] = vector
+            if use_cache:
+                cache.put(keys[index], vector)
+    return vectors
+
+def encode_sorted(texts, embedder = embedder, batch_size = None, normalize = None):
+    """Encode a list of texts in one batched pass, returning vectors in input order.
+
+    Texts are sorted by length before batching so each batch pads to a similar
+    size, and the vectors are scattered back to the caller's order afterwards.
+    """
+    if not texts:
+        return []
+    batch_size = batch_size or settings.EMBED_BATCH_SIZE
+    normalize = settings.EMBED_NORMALIZE if normalize is None else normalize
+    order = sorted(range(len(texts)), key = lambda i: len(texts[i]), reverse = True)
+    encoded = embedder.encode(
+        [texts[i] for i in order],
+        batch_size = batch_size,
+        normalize_embeddings = normalize,
+        show_progress_bar = False
+    )
+    vectors = [None] * len(texts)
+    for position, index in enumerate(order):
+        vectors[index] = encoded[position]
+    return vectors
+
+def embed_texts(texts, embedder = embedder, batch_size = None, normalize = None, cache = embedding_cache, model_name = None):
+    """Embed chunk texts, serving repeats from the embedding cache and encoding only the misses."""
+    if cache is None or not texts:
+        return encode_sorted(texts, embedder, batch_size, normalize)
+    normalize = settings.EMBED_NORMALIZE if normalize is None else normalize
+    model_name = f"{model_name or EMBEDDER_NAME}|normalize={normalize}"
+    keys = [cache.key(model_name, text) for text in texts]
+    found = cache.get_many(keys)
+    missing = [index for index, key in enumerate(keys) if key not in found]
+    if missing:
+        encoded = encode_sorted([texts[i] for i in missing], embedder, batch_size, normalize)
+        fresh = {}
+        for index, vector in zip(missing, encoded):
+            fresh[keys[index]] = vector
+        cache.put_many(list(fresh.items()))
+        found.update(fresh)
+    return [found[key] for key in keys]
+
+def compact_properties(chunk):
+    """Stored properties in the compact layout: a reference to the chunk's sentences in the sentence store."""
+    properties = {
+        "title": chunk["paper-name"],
+        "page": chunk["metadata"]["page"],
+        "sentence": chunk["sentence"]
+    }
+    for name in ("document_id", "subject"):
+        if chunk["metadata"].get(name) is not None:
+            properties[name] = chunk["metadata"][name]
+    return properties
+
+FILTER_PROPERTIES = [
+    {"name":"document_id", "dataType":["int"], "indexFilterable": True},
+    {"name":"subject", "dataType":["text"], "tokenization": "field", "indexFilterable": True}
+]
+# First-sentence index of compact-layout objects
+REFERENCE_PROPERTIES = [{"name":"sentence", "dataType":["int"], "indexFilterable": False, "indexSearchable": False}]
+
+def vector_index_config():
+    """HNSW settings and optional PQ/BQ compression for the Document class, from Settings."""
+    config = {
+        "distance": "cosine",
+        "ef": settings.HNSW_EF,
+        "efConstruction": settings.HNSW_EF_CONSTRUCTION,
+        "maxConnections": settings.HNSW_MAX_CONNECTIONS
+    }
+    if settings.VECTOR_COMPRESSION == "pq":
+        config["pq"] = {"enabled": True, "trainingLimit": settings.PQ_TRAINING_LIMIT}
+        if settings.PQ_SEGMENTS > 0:
+            config["pq"]["segments"] = settings.PQ_SEGMENTS
+    elif settings.VECTOR_COMPRESSION == "bq":
+        config["bq"] = {"enabled": True}
+    elif settings.VECTOR_COMPRESSION != "none":
+        raise ValueError(f"Unknown vector compression: {settings.VECTOR_COMPRESSION}")
+    return config
+
+def document_class(name = "Document"):
+    return {
+        "class":name,
+        "properties": [
+            {"name": "text", "dataType":["text"]},
+            {"name":"source", "dataType":["text"]},
+            {"name":"page", "dataType":["text"]},
+            {"name":"title", "dataType":["text"]},
+            {"name":"authors", "dataType":["text[]"]}
+        ] + FILTER_PROPERTIES + REFERENCE_PROPERTIES,
+        "vectorizer": "none",
+        "vectorIndexType": "hnsw",
+        "vectorIndexConfig": vector_index_config()
+    }
+
+def where_filter(filters):
+    """Translate retrieval filters ({"document_id", "subject", "author"}) into a Weaviate where clause."""
+    operands = []
+    document_id = filters.get("document_id")
+    if isinstance(document_id, (list, tuple)):
+        operands.append({"path":["document_id"], "operator":"ContainsAny", "valueInt":list(document_id)})
+    elif document_id is not None:
+        operands.append({"path":["document_id"], "operator":"Equal", "valueInt":document_id})
+    if filters.get("subject"):
+        operands.append({"path":["subject"], "operator":"Equal", "valueText":filters["subject"]})
+    if filters.get("author"):
+        # `authors` is word-tokenized, so "Ada Lovelace" would also match "Ada Smith"; documents are
+        # matched by the ids store_filters resolved for the exact name instead. No document has
+        # id -1, so an author without documents matches nothing
+        operands.append({"path":["document_id"], "operator":"ContainsAny", "valueInt":filters.get("author_document_ids") or [-1]})
+    if not operands:
+        return None
+    if len(operands) == 1:
+        return operands[0]
+    return {"operator":"And", "operands":operands}
+
+def graphql_value(value, key = None):
+    """Render a Python value as a GraphQL input literal (operators are enums, so unquoted)."""
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{name}: {graphql_value(item, name)}" for name, item in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(graphql_value(item) for item in value) + "]"
+    if key == "operator":
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if hasattr(value, "tolist"):
+        return graphql_value(value.tolist())
+    return json.dumps(value)
+
+
+def graphql_document(arguments, properties, additional, alias = None):
+    arguments = ", ".join(f"{name}: {graphql_value(value)}" for name, value in arguments.items() if value is not None)
+    prefix = f"{alias}: " if alias else ""
+    return prefix + "Document(" + arguments + ") { " + " ".join(properties) + " _additional { " + " ".join(additional) + " } }"
+
+
+def graphql_get(arguments, properties, additional):
+    """Build a Get query for the Document class, as the v3 client would send it."""
+    return "{ Get { " + graphql_document(arguments, properties, additional) + " } }"
+
+
+class WeaviateDB(VectorStore):
+    def __init__(self, url_link, sentences = SENTENCE_STORE):
+        self.url = url_link.rstrip("/")
+        self.sentences = sentences
         self.client = weaviate.Client(url = url_link)
+        self._async_client = None
     
     def ensure_schema(self):
         if not self.client.schema.contains({"class":"Document"}):
-            self.client.schema.create_class(
-                {
-                    "class":"Document",
-                    "properties": [
-                        {"name": "text", "dataType":["text"]},
-                        {"name":"source", "dataType":["text"]},
-                        {"name":"page", "dataType":["text"]},
-                        {"name":"title", "dataType":["text"]},
-                        {"name":"authors", "dataType":["text[]"]}
-                    ],
-                    "vectorizer": "none"
-                }
-            )
+            self.client.schema.create_class(document_class())
+        else:
+            # Classes created before the filter properties existed get them added in place
+            existing = {prop["name"] for prop in self.client.schema.get("Document").get("properties", [])}
+            for prop in FILTER_PROPERTIES + REFERENCE_PROPERTIES:
+                if prop["name"] not in existing:
+                    self.client.schema.property.create("Document", prop)
+            self.update_index_config()
+        if self.sentences is not None and settings.RETRIEVAL_MODE == "hybrid":
+            print("Warning: compact-layout objects store no text, so BM25 only matches their titles")
+
+    def update_index_config(self):
+        """Apply the configured index settings that Weaviate can change on a live class.
+
+        ef and enabling PQ are applied in place. efConstruction, maxConnections and BQ only
+        take effect when the index is rebuilt, so differences there are reported and left
+        for scripts/weaviate_reindex.py.
+        """
+        current = self.client.schema.get("Document").get("vectorIndexConfig", {})
+        wanted = vector_index_config()
+        update = {}
+        if current.get("ef") != wanted["ef"]:
+            update["ef"] = wanted["ef"]
+        if "pq" in wanted and not current.get("pq", {}).get("enabled"):
+            update["pq"] = wanted["pq"]
+        rebuild = [name for name in ("efConstruction", "maxConnections") if current.get(name) != wanted[name]]
+        if "bq" in wanted and not current.get("bq", {}).get("enabled"):
+            rebuild.append("bq")
+        if update:
+            try:
+                self.client.schema.update_config("Document", {"vectorIndexConfig": update})
+                print(f"Updated Document vector index config: {update}")
+            except Exception as e:
+                print(f"Could not update Document vector index config: {e}")
+        if rebuild:
+            print(f"Document vector index differs from settings in {', '.join(rebuild)}; run scripts/weaviate_reindex.py to rebuild it")
     
     def upload_file(self, chunks):
+        vectors = embed_texts([chunk["text"] for chunk in chunks])
+        self.write_chunks(chunks, vectors)
+
+    def write_chunks(self, chunks, vectors):
+        """Write already-embedded chunks, falling back to one request per object if the batch request fails.
+
+        Raises if any object could not be stored, so the ingest job fails and is retried
+        instead of being marked done without its vectors.
+        """
+        if not chunks:
+            print("No chunks to upload")
+            return
         try:
-            # Prepare batch data for efficient upload
-            batch_data = []
-            
-            for chunk in chunks:
-                embedding = embedder.encode(chunk["text"])
-                batch_data.append({
-                    "text": chunk["text"],
-                    "source": chunk["metadata"]["source"],
-                    "page": chunk["metadata"]["page"],
-                    "title": chunk["paper-name"],
-                    "authors": chunk["authors"],
-                    "vector": embedding
-                })
-            
-            # Use batch upload for better performance
-            if batch_data:
+            if self.sentences is not None:
+                self.sentences.add_chunks(chunks)
+            try:
+                # Use batch upload for better performance
                 with self.client.batch as batch:
-                    for data in batch_data:
+                    for chunk, embedding in zip(chunks, vectors):
                         batch.add_data_object(
-                            data_object={
-                                "text": data["text"],
-                                "source": data["source"],
-                                "page": data["page"],
-                                "title": data["title"],
-                                "authors": data["authors"]
-                            },
+                            data_object=self.stored_properties(chunk),
                             class_name="Document",
-                            vector=data["vector"]
+                            vector=embedding
                         )
-                
-                print(f"Successfully uploaded {len(batch_data)} chunks to Weaviate")
-            else:
-                print("No chunks to upload")
-                
-        except Exception as e:
-            print(f"Error in batch upload to Weaviate: {e}")
-            # Fallback to individual uploads if batch fails
-            for chunk in chunks:
-                try:
-                    embedding = embedder.encode(chunk["text"])
-                    self.client.data_object.create(
-                        {
-                            "text": chunk["text"],
-                            "source": chunk["metadata"]["source"],
-                            "page": chunk["metadata"]["page"],
-                            "title": chunk["paper-name"],
-                            "authors": chunk["authors"]
-                        },
-                        class_name="Document",
-                        vector=embedding
-                    )
-                except Exception as chunk_error:
-                    print(f"Error uploading individual chunk: {chunk_error}")
-    
-    def upload_folder(self, doc_directory, loader, metadata):
-        all_files = os.listdir(doc_directory)
-        for index, filename in all_files:
-            try:
-              file_path = os.path.join(doc_directory, filename)
-              chunks = loader.load(file_path, metadata[index]['title'], metadata[index]['authors'])
-              self.upload_file(chunks)
-
+                    results = batch.create_objects()
             except Exception as e:
-                print(e)        
+                print(f"Error in batch upload to Weaviate: {e}")
+                # Fallback to individual uploads if the batch request fails, reusing the vectors already computed
+                failed = 0
+                for chunk, embedding in zip(chunks, vectors):
+                    try:
+                        self.client.data_object.create(
+                            self.stored_properties(chunk),
+                            class_name="Document",
+                            vector=embedding
+                        )
+                    except Exception as chunk_error:
+                        failed += 1
+                        print(f"Error uploading individual chunk: {chunk_error}")
+                if failed:
+                    raise Exception(f"Could not store {failed} of {len(chunks)} chunks in Weaviate") from e
+                return
+            # A batch request can succeed while some of its objects are rejected; the job's retry
+            # deletes what was stored, so nothing is re-sent here
+            errors = [result["result"]["errors"] for result in results or [] if (result.get("result") or {}).get("errors")]
+            if errors:
+                raise Exception(f"Weaviate rejected {len(errors)} of {len(chunks)} chunks: {errors[0]}")
+            print(f"Successfully uploaded {len(chunks)} chunks to Weaviate")
+        finally:
+            self.bump_corpus_version()
 
-    def retrieve(self, query, embedder = embedder):
-        query_vector = embedder.encode(query)
-        results = self.client.query.get("Document", ["text", "source", "page", "title", "authors"]).with_near_vector({"vector":query_vector}).with_additional(["certainty"]).with_limit(20).do()
-        return results['data']['Get']['Document']
+    def stored_properties(self, chunk):
+        return chunk_properties(chunk) if self.sentences is None else compact_properties(chunk)
+
+    def query_properties(self, properties):
+        properties = properties or FULL_PROPERTIES
+        if self.sentences is None:
+            return properties
+        # Full-layout objects written before the switch still come back with their text
+        return list(dict.fromkeys(properties + ["title", "page", "sentence"]))
+
+    def store_filters(self, filters):
+        filters = dict(filters or {})
+        if filters.get("author"):
+            filters["author_document_ids"] = document_ids_by_author(filters["author"])
+        return filters
+
+    def hydrate(self, hits, properties):
+        """Rebuild text, source and authors of compact-layout hits and drop the reference fields."""
+        if self.sentences is None:
+            return hits
+        hits = self.sentences.hydrate(hits)
+        wanted = set(properties or FULL_PROPERTIES) | {"_additional"}
+        return [{name: value for name, value in hit.items() if name in wanted} for hit in hits]
+
+    def vector_search(self, query_vector, limit, certainty = None, properties = None, filters = None):
+        near_vector = {"vector":query_vector}
+        if certainty is not None:
+            near_vector["certainty"] = certainty
+        query = self.client.query.get("Document", self.query_properties(properties)).with_near_vector(near_vector).with_additional(["certainty"]).with_limit(limit)
+        where = where_filter(self.store_filters(filters))
+        if where is not None:
+            query = query.with_where(where)
+        if settings.RETRIEVAL_AUTOCUT > 0:
+            # Let Weaviate stop at the first big jump in distance instead of always returning `limit` hits
+            query = query.with_autocut(settings.RETRIEVAL_AUTOCUT)
+        results = query.do()
+        return self.hydrate(results['data']['Get']['Document'], properties)
+
+    def keyword_search(self, query, limit, properties = None, filters = None):
+        query = self.client.query.get("Document", self.query_properties(properties)).with_bm25(query = query).with_additional(["score"]).with_limit(limit)
+        where = where_filter(self.store_filters(filters))
+        if where is not None:
+            query = query.with_where(where)
+        results = query.do()
+        return self.hydrate(results['data']['Get']['Document'], properties)
+
+    @property
+    def async_client(self):
+        # One pooled client for the whole process: requests from concurrent chats reuse
+        # keep-alive connections instead of each opening its own
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url = self.url,
+                limits = httpx.Limits(
+                    max_connections = settings.WEAVIATE_MAX_CONNECTIONS,
+                    max_keepalive_connections = settings.WEAVIATE_KEEPALIVE_CONNECTIONS
+                ),
+                timeout = settings.WEAVIATE_TIMEOUT_SECONDS
+            )
+        return self._async_client
+
+    async def apost_graphql(self, query):
+        response = await self.async_client.post("/v1/graphql", json = {"query": query})
+        response.raise_for_status()
+        results = response.json()
+        if results.get("errors"):
+            raise RuntimeError(results["errors"])
+        return results['data']['Get']
+
+    async def agraphql(self, query):
+        return (await self.apost_graphql(query))['Document']
+
+    async def awhere(self, filters):
+        """where_filter of store_filters, resolved in a thread since it may query the database."""
+        return where_filter(await asyncio.to_thread(self.store_filters, filters))
+
+    def near_vector_arguments(self, query_vector, limit, certainty, where):
+        near_vector = {"vector":[float(value) for value in query_vector]}
+        if certainty is not None:
+            near_vector["certainty"] = certainty
+        return {
+            "nearVector": near_vector,
+            "where": where,
+            "limit": limit,
+            "autocut": settings.RETRIEVAL_AUTOCUT if settings.RETRIEVAL_AUTOCUT > 0 else None
+        }
+
+    async def avector_search(self, query_vector, limit, certainty = None, properties = None, filters = None):
+        hits = await self.agraphql(graphql_get(
+            self.near_vector_arguments(query_vector, limit, certainty, await self.awhere(filters)),
+            self.query_properties(properties),
+            ["certainty"]
+        ))
+        return self.hydrate(hits, properties)
+
+    async def abatch_vector_search(self, query_vectors, limit, certainty = None, properties = None, filters = None):
+        """Several nearVector searches as aliased fields of one GraphQL request per BATCH_SEARCH_GROUP vectors."""
+        group = max(settings.BATCH_SEARCH_GROUP, 1)
+        where = await self.awhere(filters)
+
+        async def search_group(vectors):
+            fields = [
+                graphql_document(self.near_vector_arguments(vector, limit, certainty, where), self.query_properties(properties),
+                                 ["certainty"], alias = f"q{index}")
+                for index, vector in enumerate(vectors)
+            ]
+            results = await self.apost_graphql("{ Get { " + " ".join(fields) + " } }")
+            return [self.hydrate(results[f"q{index}"], properties) for index in range(len(vectors))]
+
+        groups = await asyncio.gather(*(
+            search_group(query_vectors[start:start + group]) for start in range(0, len(query_vectors), group)
+        ))
+        return [hits for results in groups for hits in results]
+
+    async def akeyword_search(self, query, limit, properties = None, filters = None):
+        hits = await self.agraphql(graphql_get(
+            {"bm25": {"query": query}, "where": await self.awhere(filters), "limit": limit},
+            self.query_properties(properties),
+            ["score"]
+        ))
+        return self.hydrate(hits, properties)
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
     
     def delete(self, title:str):
+       return self.delete_where({"path": ['title'], "operator":"Equal", "valueText":title}, title)
+
+    def delete_document(self, document_id, title):
+       """Delete the chunks of one document by its id; `title` (exact) clears its sentence-store rows."""
+       return self.delete_where({"path": ['document_id'], "operator":"Equal", "valueInt":document_id}, title)
+
+    def delete_where(self, where, title):
        try:
           results = self.client.batch.delete_objects(
              class_name = "Document",
-             where = {
-                "path": ['title'],
-                "operator":"Equal",
-                "valueText":title
-             }
+             where = where
           )
 
           print(results)
           if results and "results" in results:
-             if results['results']['failed'] == 0 and results['results']['successful'] != 0:
+             if results['results']['successful'] != 0:
+                self.bump_corpus_version()
+             if results['results']['failed'] == 0 and self.sentences is not None:
+                self.sentences.delete(title)
+             if results['results']['failed'] != 0:
+               return {
+                  "success":False,
+                  "message":f"Failed to delete {results['results']['failed']} items from the Vector Store"
+               }
+             if results['results']['successful'] != 0:
                return {
                   "success":True,
                   "message":f"Deleted {results['results']['successful']} items from the Vector Store",
                }
-          else:
-             return {
-                "success":False,
-                "message":"Could not find any items in Vector Store"
-             }
+          return {
+             "success":False,
+             "message":"Could not find any items in Vector Store"
+          }
        except Exception as e:
           return {
              "success":False,
@@ -133,34 +476,44 @@ class PDFLoader(BasePDFLoader):
     def __init__(self, embedder: SentenceTransformer = embedder) -> None:
         self.embedder = embedder
     
-    def load(self, file_name, document_name, authors_list, file_link):
-        doc = fitz.open(file_name)
+    def page_ranges(self, page_count, workers, parts = 1):
+        """Split [0, page_count) into contiguous (first, last) ranges, `parts` per worker."""
+        step = -(-page_count // (workers * parts))
+        return [(first, min(first + step, page_count)) for first in range(0, page_count, step)]
+
+    def load(self, file_name, document_name, authors_list, file_link, workers = None, metadata = None):
         documents = []
-        for pageNum, page in enumerate(doc):
-            blocks = page.get_text("blocks")
-            full_text = ""
-            for block in blocks:
-                block_text = block[4]
-                block_type = block[6] if len(block)>6 else 0
-                if block_type == 0:
-                    full_text = full_text + block_text + "\n"
-                else:
-                    continue
-            
-            full_text = full_text.replace("\n", " ")
-            full_text = full_text.replace("- ", "")
-            sentences = re.split(r'(?<=[.?!])\s+', full_text)
-
-            
-            for start in range(len(sentences) - 2):
-                chunk = ' '.join(sent for sent in sentences[start:start+3])
-                documents.append({
-                    "text" : chunk,
-                    "paper-name": document_name,
-                    "authors": authors_list,
-                    "metadata" : {
-                        "page": str(pageNum + 1),
-                        "source": file_link,
-                    }
-                })
-        return documents
\ No newline at end of file
+        for chunks in self.iter_pages(file_name, document_name, authors_list, file_link, metadata, workers = workers, parts = 1):
+            documents.extend(chunks)
+        return documents
+
+    def iter_pages(self, file_name, document_name, authors_list, file_link, metadata = None, workers = None, parts = 4):
+        """Yield the chunks of one page at a time, in page order, so callers can start embedding before parsing finishes.
+
+        Documents of at least PDF_PARALLEL_MIN_PAGES pages are parsed across `workers`
+        processes (PDF_PARSE_WORKERS by default) in `parts` ranges per worker. Only a
+        couple of ranges per worker are in flight at once, and results are yielded in
+        submission order.
+        """
+        doc = fitz.open(file_name)
+        page_count = doc.page_count
+        workers = settings.PDF_PARSE_WORKERS if workers is None else workers
+        if workers <= 1 or page_count < settings.PDF_PARALLEL_MIN_PAGES:
+            try:
+                for pageNum, page in enumerate(doc):
+                    yield page_chunks(page, pageNum, document_name, authors_list, file_link, metadata)
+            finally:
+                doc.close()
+            return
+
+        doc.close()
+        workers = min(workers, page_count)
+        ranges = self.page_ranges(page_count, workers, parts)
+        with parse_pool(workers) as pool:
+            futures = deque()
+            for first, last in ranges:
+                futures.append(pool.submit(load_page_range, file_name, first, last, document_name, authors_list, file_link, metadata))
+                if len(futures) >= workers * 2:
+                    yield from futures.popleft().result()
+            while futures:
+                yield from futures.popleft().result()
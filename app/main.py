@@ -40,6 +40,18 @@ app.include_router(auth.router, prefix = f"{settings.PROJECT_URL_V1}/auth", tags
 app.include_router(document.router, prefix = f"{settings.PROJECT_URL_V1}/document", tags = ["document"])
 app.include_router(chats.router, prefix = f"{settings.PROJECT_URL_V1}/chats", tags = ["chats"])
 
+@app.on_event("startup")
+def start_ingest_workers():
+    if settings.INGEST_WORKERS_IN_PROCESS > 0:
+        from app.worker import start_workers
+        start_workers(settings.INGEST_WORKERS_IN_PROCESS)
+
+@app.on_event("shutdown")
+async def close_clients():
+    from app.helpers.llm_pool import LLM_POOL
+    await document.vector_store.aclose()
+    await LLM_POOL.aclose()
+
 @app.get("/")
 def root():
     return {"message": "Welcome to LocuSearch"}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
 from sqlalchemy.orm import relationship
 import re
 from datetime import datetime
@@ -20,6 +20,9 @@ class Chat(Base):
     __tablename__ = "chats"
     chat_id = Column(Integer, primary_key=True, index = True)
     parent_query_id = Column(Integer, ForeignKey('query.query_id'), index = True, unique = True)
+    # Rolling summary of the messages older than the recent window sent verbatim to the model
+    summary = Column(Text, nullable = True)
+    summarized_until = Column(Integer, nullable = True)
 
     parent_query = relationship("QuerySearch", back_populates="chat")
     messages = relationship("ChatMessage", back_populates="chat", cascade="all, delete-orphan")
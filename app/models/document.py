@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Float
 from sqlalchemy.orm import validates, relationship
 import re
 from datetime import datetime
@@ -14,6 +14,8 @@ class Document(Base):
     uploaded_by = Column(String, ForeignKey('users.user_id'), index = True)
     upload_date = Column(DateTime, default = datetime.utcnow)
     subject = Column(String, index = True, nullable =True)
+    # Unique, but NULL for documents uploaded before hashing, which are not deduplicated
+    content_hash = Column(String(64), index = True, unique = True, nullable = True)
 
     authors = relationship("AuthorConnection", back_populates="document", cascade="all, delete-orphan")
 
@@ -26,4 +28,38 @@ class AuthorConnection(Base):
     document_conn = Column(Integer, ForeignKey('documents.document_id'))
     primary_author = Column(Boolean, default = False)
 
-    document = relationship("Document", back_populates="authors")
\ No newline at end of file
+    document = relationship("Document", back_populates="authors")
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    job_id = Column(Integer, primary_key = True, index = True)
+    document_id = Column(Integer, ForeignKey('documents.document_id', ondelete = "CASCADE"), index = True)
+    file_path = Column(String, nullable = False)
+    document_name = Column(String, nullable = False)
+    authors = Column(String, nullable = False, default = "[]")
+    document_link = Column(String, nullable = True)
+    status = Column(String, nullable = False, default = "queued", index = True)
+    attempts = Column(Integer, nullable = False, default = 0)
+    max_attempts = Column(Integer, nullable = False, default = 3)
+    error = Column(String, nullable = True)
+    pages = Column(Integer, nullable = True)
+    chunks = Column(Integer, nullable = True)
+    embed_batches = Column(Integer, nullable = True)
+    parse_seconds = Column(Float, nullable = True)
+    embed_seconds = Column(Float, nullable = True)
+    write_seconds = Column(Float, nullable = True)
+    total_seconds = Column(Float, nullable = True)
+    created_at = Column(DateTime, default = datetime.utcnow, index = True)
+    updated_at = Column(DateTime, default = datetime.utcnow, onupdate = datetime.utcnow)
+
+class CorpusVersion(Base):
+    """One row, bumped whenever a document's chunks are added to or removed from the vector store.
+
+    Shared by the API and ingest worker processes, so cached answers are invalidated no matter
+    which process changed the corpus.
+    """
+    __tablename__ = "corpus_version"
+
+    id = Column(Integer, primary_key = True)
+    version = Column(Integer, nullable = False, default = 0)
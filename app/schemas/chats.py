@@ -1,9 +1,22 @@
-from typing import Optional
+from typing import Optional, List
 from pydantic import BaseModel
 from datetime import datetime
 
+class SearchFilters(BaseModel):
+    document_id: Optional[int] = None
+    subject: Optional[str] = None
+    author: Optional[str] = None
+
 class QueryBase(BaseModel):
     query: str 
+    certainty: Optional[float] = None
+    filters: Optional[SearchFilters] = None
+
+class BatchSearch(BaseModel):
+    queries: List[str]
+    certainty: Optional[float] = None
+    filters: Optional[SearchFilters] = None
+    answer: bool = False
 
 class QueryCreate(QueryBase):
     pass
@@ -33,3 +46,5 @@ class OpenChat(BaseModel):
 class SendMessage(BaseModel):
     query: str
     chat_id: int
+    certainty: Optional[float] = None
+    filters: Optional[SearchFilters] = None
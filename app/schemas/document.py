@@ -20,6 +20,7 @@ class DocumentInDB(DocumentBase):
     document_link: str
     uploaded_by: str
     upload_date: datetime
+    content_hash: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -29,6 +30,34 @@ class DocumentDelete(BaseModel):
 class Document(DocumentInDB):
     pass
 
+class UploadResponse(Document):
+    job_id: Optional[int] = None
+
+class IngestJob(BaseModel):
+    job_id: int
+    document_id: Optional[int]
+    document_name: str
+    status: str
+    attempts: int
+    max_attempts: int
+    error: Optional[str]
+    created_at: datetime
+    updated_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class IngestStatus(IngestJob):
+    pages: Optional[int] = None
+    chunks: Optional[int] = None
+    embed_batches: Optional[int] = None
+    parse_seconds: Optional[float] = None
+    embed_seconds: Optional[float] = None
+    write_seconds: Optional[float] = None
+    total_seconds: Optional[float] = None
+    pages_per_second: Optional[float] = None
+    embed_chunks_per_second: Optional[float] = None
+
 class ConnectionBase(BaseModel):
     authorname : str
     authoremail: Optional[str]
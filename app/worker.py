@@ -0,0 +1,331 @@
+"""Ingest worker pool that consumes the ingest_jobs table.
+
+The API starts INGEST_WORKERS_IN_PROCESS threads of it itself (1 by default, which is how
+the Cloud Run service runs). To run workers separately, set that to 0 and start
+`python -m app.worker --concurrency 4` next to the API. Uploads are spooled to S3
+(INGEST_SPOOL_STORAGE), so a worker need not share a disk with the instance that took the upload.
+"""
+import argparse
+import json
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.document import Document, IngestJob
+from app.helpers.ingest import bulk_ingest
+from app.helpers.spool import local_copy, remove_spooled
+from app.helpers.corpus_version import bump_shared_corpus_version
+
+
+def requeue_stale_jobs(db):
+    """Put jobs left 'running' by a crashed or restarted worker back on the queue.
+
+    Live workers renew their jobs' lease through keep_leases, so only jobs whose worker
+    stopped heartbeating for INGEST_JOB_LEASE_SECONDS count as stale. A stale job that has
+    used all its attempts (one that keeps killing its worker, say) is failed and cleaned up
+    instead of being requeued forever.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds = settings.INGEST_JOB_LEASE_SECONDS)
+    stale = db.query(IngestJob).filter(IngestJob.status == "running", IngestJob.updated_at < cutoff).all()
+    requeued = 0
+    for job in stale:
+        exhausted = job.attempts >= job.max_attempts
+        # Conditional, so a job renewed or requeued by another process meanwhile is left alone
+        claimed = db.query(IngestJob).filter(
+            IngestJob.job_id == job.job_id, IngestJob.status == "running", IngestJob.updated_at < cutoff
+        ).update({"status": "failed" if exhausted else "queued", "updated_at": datetime.utcnow()}, synchronize_session = False)
+        db.commit()
+        if not claimed:
+            continue
+        db.refresh(job)
+        if exhausted:
+            print(f"Ingest job {job.job_id} failed: its worker stopped on all {job.max_attempts} attempts")
+            job.error = f"Worker stopped while processing the job ({job.attempts}/{job.max_attempts} attempts)"
+            discard_job(db, job)
+            db.commit()
+        else:
+            requeued += 1
+    if requeued:
+        print(f"Requeued {requeued} stale ingest jobs")
+    return requeued
+
+
+def requeue_loop(stop):
+    """Run requeue_stale_jobs every third of the lease, so jobs of a dead worker do not wait for a restart."""
+    interval = max(settings.INGEST_JOB_LEASE_SECONDS / 3, 1)
+    while not stop.is_set():
+        db = SessionLocal()
+        try:
+            requeue_stale_jobs(db)
+        except Exception as e:
+            db.rollback()
+            print(f"Could not requeue stale ingest jobs: {e}")
+        finally:
+            db.close()
+        stop.wait(interval)
+
+
+def claim_jobs(db, limit = 1):
+    """Atomically move up to `limit` of the oldest queued jobs to 'running' and return them.
+
+    A job that was tried before may be the one that took its whole batch down, so it is
+    claimed on its own rather than with fresh jobs.
+    """
+    claimed_jobs = []
+    candidates = db.query(IngestJob).filter(
+        IngestJob.status == "queued", IngestJob.attempts < IngestJob.max_attempts
+    ).order_by(IngestJob.created_at.asc()).limit(limit).all()
+    if candidates and candidates[0].attempts > 0:
+        candidates = candidates[:1]
+    else:
+        candidates = [job for job in candidates if job.attempts == 0]
+    for job in candidates:
+        claimed = db.query(IngestJob).filter(IngestJob.job_id == job.job_id, IngestJob.status == "queued").update(
+            {"status": "running", "attempts": IngestJob.attempts + 1, "updated_at": datetime.utcnow()},
+            synchronize_session = False
+        )
+        db.commit()
+        if claimed:
+            db.refresh(job)
+            claimed_jobs.append(job)
+    return claimed_jobs
+
+
+def keep_leases(job_ids, done):
+    """Touch updated_at of the given running jobs every third of the lease until `done` is set."""
+    interval = max(settings.INGEST_JOB_LEASE_SECONDS / 3, 1)
+    while not done.wait(interval):
+        db = SessionLocal()
+        try:
+            db.query(IngestJob).filter(IngestJob.job_id.in_(job_ids), IngestJob.status == "running").update(
+                {"updated_at": datetime.utcnow()}, synchronize_session = False
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Could not renew ingest job leases {job_ids}: {e}")
+        finally:
+            db.close()
+
+
+def document_exists(db, document_id):
+    return document_id is not None and db.query(Document.document_id).filter(Document.document_id == document_id).first() is not None
+
+
+def vector_store():
+    """The API's vector store, imported on first use.
+
+    Parse-pool children re-import this module when it is run as `python -m app.worker`, so it
+    must not load the embedding model or open the stores at import time.
+    """
+    from app.api.routes.document import vector_store
+    return vector_store
+
+
+def job_output(job):
+    """What cancel_job needs, read while the job is still loaded (a rollback expires it, and the row may be gone)."""
+    return job.job_id, job.document_id, job.document_name, job.file_path
+
+
+def cancel_job(db, job_id, document_id, document_name, file_path):
+    """Drop a job whose Document was deleted, removing whatever it wrote and its spooled file.
+
+    SQLite does not enforce the foreign key, so the job row is kept and marked 'cancelled';
+    on Postgres it was already cascade-deleted with the Document and the update matches nothing.
+    """
+    print(f"Ingest job {job_id} cancelled: document {document_id} no longer exists")
+    if document_id is not None:
+        vector_store().delete_document(document_id, document_name)
+    remove_spooled(file_path)
+    db.rollback()
+    db.query(IngestJob).filter(IngestJob.job_id == job_id).update(
+        {"status": "cancelled", "document_id": None, "updated_at": datetime.utcnow()}, synchronize_session = False
+    )
+    bump_shared_corpus_version(db)
+    db.commit()
+
+
+def job_metadata(db, job):
+    """Filterable fields stored on every chunk of the job's document."""
+    doc = db.query(Document).filter(Document.document_id == job.document_id).first()
+    return {"document_id": job.document_id, "subject": doc.subject if doc else None}
+
+
+def process_job(db, job):
+    if not document_exists(db, job.document_id):
+        return cancel_job(db, *job_output(job))
+    try:
+        if job.attempts > 1:
+            # Clear anything a failed earlier attempt managed to write
+            vector_store().delete_document(job.document_id, job.document_name)
+        from app.api.routes.document import ingest_file
+        with local_copy(job.file_path) as file_path:
+            stats = ingest_file(file_path, job.document_name, json.loads(job.authors), job.document_link, job_metadata(db, job))
+        record_stats(job, stats)
+        finish_job(db, job)
+    except Exception as e:
+        fail_job(db, job, e)
+
+
+def process_jobs(db, jobs):
+    """Ingest several jobs as one bulk batch so parsing and embedding are shared across documents."""
+    live = []
+    for job in jobs:
+        if document_exists(db, job.document_id):
+            live.append(job)
+        else:
+            cancel_job(db, *job_output(job))
+    jobs = live
+    if not jobs:
+        return
+    if len(jobs) == 1:
+        return process_job(db, jobs[0])
+    try:
+        for job in jobs:
+            if job.attempts > 1:
+                vector_store().delete_document(job.document_id, job.document_name)
+        with ExitStack() as stack:
+            entries = [
+                {"file_path": stack.enter_context(local_copy(job.file_path)), "title": job.document_name, "authors": json.loads(job.authors),
+                 "link": job.document_link, "metadata": job_metadata(db, job)}
+                for job in jobs
+            ]
+            report = bulk_ingest(vector_store(), entries)
+    except Exception as e:
+        for job in jobs:
+            fail_job(db, job, e)
+        return
+
+    pipeline = report["pipeline"]
+    total_chunks = max(pipeline["chunks"], 1)
+    for job, document in zip(jobs, report["documents"]):
+        if document["error"]:
+            fail_job(db, job, Exception(document["error"]))
+            continue
+        # Embedding and writes are shared by the batch, so apportion them by chunk count; the
+        # total is this document's own share, so per-document histograms do not rank whole batches
+        share = document["chunks"] / total_chunks
+        job.pages = document["pages"]
+        job.chunks = document["chunks"]
+        job.embed_batches = round(pipeline["embed"]["items"] * share)
+        job.parse_seconds = document["parse_seconds"]
+        job.embed_seconds = pipeline["embed"]["seconds"] * share
+        job.write_seconds = pipeline["write"]["seconds"] * share
+        job.total_seconds = job.parse_seconds + job.embed_seconds + job.write_seconds
+        finish_job(db, job)
+
+
+def finish_job(db, job):
+    output = job_output(job)
+    # The document may have been deleted while it was being ingested
+    if not document_exists(db, job.document_id):
+        return cancel_job(db, *output)
+    job.status = "done"
+    job.error = None
+    bump_shared_corpus_version(db)
+    try:
+        db.commit()
+    except StaleDataError:
+        # Deleted between the check and the commit, taking the job row with it
+        return cancel_job(db, *output)
+    remove_spooled(job.file_path)
+
+
+def fail_job(db, job, error):
+    output = job_output(job)
+    db.rollback()
+    if not document_exists(db, output[1]):
+        return cancel_job(db, *output)
+    print(f"Ingest job {job.job_id} failed (attempt {job.attempts}/{job.max_attempts}): {error}")
+    job.error = str(error)
+    if job.attempts >= job.max_attempts:
+        discard_job(db, job)
+    else:
+        job.status = "queued"
+    db.commit()
+
+
+def discard_job(db, job):
+    """Mark a job failed for good and remove its chunks, Document row and spooled file. The caller commits."""
+    job.status = "failed"
+    # No retry will overwrite what the job managed to write, so remove it
+    if job.document_id is not None:
+        result = vector_store().delete_document(job.document_id, job.document_name)
+        if not result["success"]:
+            print(f"Ingest job {job.job_id}: {result['message']}")
+    doc = db.query(Document).filter(Document.document_id == job.document_id).first()
+    job.document_id = None
+    if doc:
+        db.delete(doc)
+    bump_shared_corpus_version(db)
+    remove_spooled(job.file_path)
+
+
+def record_stats(job, stats):
+    job.pages = stats["parse"]["items"]
+    job.chunks = stats["chunks"]
+    job.embed_batches = stats["embed"]["items"]
+    job.parse_seconds = stats["parse"]["seconds"]
+    job.embed_seconds = stats["embed"]["seconds"]
+    job.write_seconds = stats["write"]["seconds"]
+    job.total_seconds = stats["total_seconds"]
+
+
+def worker_loop(stop):
+    while not stop.is_set():
+        db = SessionLocal()
+        try:
+            jobs = claim_jobs(db, settings.INGEST_BATCH_DOCS)
+            if not jobs:
+                stop.wait(settings.INGEST_POLL_SECONDS)
+                continue
+            # Long documents outlive the lease, so renew it while they are processed
+            done = threading.Event()
+            heartbeat = threading.Thread(target = keep_leases, args = ([job.job_id for job in jobs], done), daemon = True)
+            heartbeat.start()
+            try:
+                process_jobs(db, jobs)
+            finally:
+                done.set()
+                heartbeat.join()
+        except Exception as e:
+            print(f"Ingest worker error: {e}")
+            stop.wait(settings.INGEST_POLL_SECONDS)
+        finally:
+            db.close()
+
+
+def start_workers(concurrency, stop = None):
+    stop = stop or threading.Event()
+    threads = [threading.Thread(target = requeue_loop, args = (stop,), name = "ingest-requeue", daemon = True)]
+    threads[0].start()
+    for index in range(concurrency):
+        thread = threading.Thread(target = worker_loop, args = (stop,), name = f"ingest-worker-{index}", daemon = True)
+        thread.start()
+        threads.append(thread)
+    print(f"Started {concurrency} ingest workers")
+    return stop, threads
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type = int, default = settings.INGEST_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    stop, threads = start_workers(args.concurrency)
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Compare per-chunk encoding against the batched embed_texts stage.
+
+Usage:
+    python -m scripts.bench_embedding path/to/paper.pdf [--batch-size 64]
+"""
+import argparse
+import time
+
+from app.helpers.weaviate import PDFLoader, embed_texts, embedder
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf")
+    parser.add_argument("--batch-size", type = int, default = 64)
+    args = parser.parse_args()
+
+    chunks = PDFLoader().load(args.pdf, "benchmark", [], args.pdf)
+    texts = [chunk["text"] for chunk in chunks]
+    print(f"{len(texts)} chunks loaded from {args.pdf}")
+
+    start = time.time()
+    for text in texts:
+        embedder.encode(text)
+    single_time = time.time() - start
+    print(f"One encode() per chunk: {single_time:.2f}s, {len(texts) / single_time:.1f} chunks/sec")
+
+    start = time.time()
+    embed_texts(texts, batch_size = args.batch_size)
+    batched_time = time.time() - start
+    print(f"Batched (batch_size={args.batch_size}): {batched_time:.2f}s, {len(texts) / batched_time:.1f} chunks/sec")
+    print(f"Speedup: {single_time / batched_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Recall, latency and memory of Weaviate vector index settings, against a local container.
+
+Each configuration is built as a throwaway "BenchHnsw" class holding the same vectors:
+a sample exported from the live Document class (--source-url), or random unit vectors.
+Recall@k is measured against exact brute-force neighbours computed with NumPy. Memory is
+the estimated in-RAM size of vectors plus graph links, and, when --metrics-url points at
+Weaviate's Prometheus endpoint (PROMETHEUS_MONITORING_ENABLED=true), the measured heap
+growth while the class is loaded.
+
+Start a local instance with, for example:
+    docker run -p 8080:8080 -p 2112:2112 -e PROMETHEUS_MONITORING_ENABLED=true \
+        -e AUTHENTICATION_ANONYMOUS_ACCESS_ENABLED=true -e DEFAULT_VECTORIZER_MODULE=none \
+        semitechnologies/weaviate:1.24.10
+
+Usage:
+    python -m scripts.bench_hnsw [--url http://localhost:8080] [--source-url $WEAVIATE_URL]
+        [--count 20000] [--queries 200] [--k 10] [--metrics-url http://localhost:2112/metrics]
+"""
+import argparse
+import re
+import time
+
+import httpx
+import numpy as np
+import weaviate
+
+CLASS_NAME = "BenchHnsw"
+
+CONFIGS = [
+    {"name": "hnsw m16 efc64", "maxConnections": 16, "efConstruction": 64},
+    {"name": "hnsw m32 efc128", "maxConnections": 32, "efConstruction": 128},
+    {"name": "hnsw m64 efc128", "maxConnections": 64, "efConstruction": 128},
+    {"name": "pq m32 efc128", "maxConnections": 32, "efConstruction": 128, "compression": "pq"},
+    {"name": "bq m32 efc128", "maxConnections": 32, "efConstruction": 128, "compression": "bq"},
+]
+EF_VALUES = [32, 64, 128, 256]
+
+
+def source_vectors(url, count):
+    client = weaviate.Client(url = url)
+    vectors = []
+    cursor = None
+    while len(vectors) < count:
+        query = client.query.get("Document", ["page"]).with_additional(["id", "vector"]).with_limit(min(500, count - len(vectors)))
+        if cursor is not None:
+            query = query.with_after(cursor)
+        objects = query.do()["data"]["Get"]["Document"]
+        if not objects:
+            break
+        vectors.extend(obj["_additional"]["vector"] for obj in objects)
+        cursor = objects[-1]["_additional"]["id"]
+    return np.asarray(vectors, dtype = np.float32)
+
+
+def unit(matrix):
+    return matrix / np.clip(np.linalg.norm(matrix, axis = 1, keepdims = True), 1e-12, None)
+
+
+def heap_bytes(metrics_url):
+    if not metrics_url:
+        return None
+    text = httpx.get(metrics_url).text
+    match = re.search(r"^go_memstats_heap_inuse_bytes (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def estimated_bytes(config, count, dim):
+    links = count * config["maxConnections"] * 2 * 8
+    if config.get("compression") == "pq":
+        return count * (dim // 6) + links
+    if config.get("compression") == "bq":
+        return count * dim // 8 + links
+    return count * dim * 4 + links
+
+
+def build(client, config, vectors):
+    index = {"distance": "cosine", "ef": EF_VALUES[0], "efConstruction": config["efConstruction"],
+             "maxConnections": config["maxConnections"]}
+    if config.get("compression") == "bq":
+        index["bq"] = {"enabled": True}
+    client.schema.create_class({
+        "class": CLASS_NAME,
+        "properties": [{"name": "row", "dataType": ["int"]}],
+        "vectorizer": "none",
+        "vectorIndexType": "hnsw",
+        "vectorIndexConfig": index
+    })
+    start = time.perf_counter()
+    client.batch.configure(batch_size = 500)
+    with client.batch as batch:
+        for row, vector in enumerate(vectors):
+            batch.add_data_object(data_object = {"row": row}, class_name = CLASS_NAME, vector = vector.tolist())
+    if config.get("compression") == "pq":
+        # PQ is trained on the imported vectors, so it is enabled after the import
+        client.schema.update_config(CLASS_NAME, {"vectorIndexConfig": {"pq": {"enabled": True, "trainingLimit": len(vectors)}}})
+        time.sleep(5)
+    return time.perf_counter() - start
+
+
+def measure(client, queries, truth, k, ef):
+    client.schema.update_config(CLASS_NAME, {"vectorIndexConfig": {"ef": ef}})
+    latencies = []
+    found = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        hits = client.query.get(CLASS_NAME, ["row"]).with_near_vector({"vector": query.tolist()}).with_limit(k).do()
+        latencies.append(time.perf_counter() - start)
+        found += len({hit["row"] for hit in hits["data"]["Get"][CLASS_NAME]} & set(expected.tolist()))
+    latencies = np.asarray(latencies) * 1000
+    return found / (len(queries) * k), np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default = "http://localhost:8080")
+    parser.add_argument("--source-url")
+    parser.add_argument("--count", type = int, default = 20000)
+    parser.add_argument("--dim", type = int, default = 768)
+    parser.add_argument("--queries", type = int, default = 200)
+    parser.add_argument("--k", type = int, default = 10)
+    parser.add_argument("--metrics-url")
+    args = parser.parse_args()
+
+    if args.source_url:
+        vectors = unit(source_vectors(args.source_url, args.count + args.queries))
+        print(f"{len(vectors)} vectors sampled from {args.source_url}")
+    else:
+        vectors = unit(np.random.default_rng(0).standard_normal((args.count + args.queries, args.dim)).astype(np.float32))
+        print(f"{len(vectors)} random unit vectors")
+    queries, corpus = vectors[:args.queries], vectors[args.queries:]
+    truth = np.argsort(-(queries @ corpus.T), axis = 1)[:, :args.k]
+
+    client = weaviate.Client(url = args.url)
+    if client.schema.contains({"class": CLASS_NAME}):
+        client.schema.delete_class(CLASS_NAME)
+    print(f"{'config':<18} {'build s':>8} {'ef':>5} {'recall':>7} {'p50 ms':>7} {'p95 ms':>7} {'est MB':>7} {'heap MB':>8}")
+    for config in CONFIGS:
+        heap_before = heap_bytes(args.metrics_url)
+        build_seconds = build(client, config, corpus)
+        heap_after = heap_bytes(args.metrics_url)
+        heap = f"{(heap_after - heap_before) / 2**20:.0f}" if heap_before is not None and heap_after is not None else "-"
+        estimate = estimated_bytes(config, len(corpus), corpus.shape[1]) / 2**20
+        for ef in EF_VALUES:
+            recall, p50, p95 = measure(client, queries, truth, args.k, ef)
+            print(f"{config['name']:<18} {build_seconds:>8.1f} {ef:>5} {recall:>7.3f} {p50:>7.2f} {p95:>7.2f} {estimate:>7.0f} {heap:>8}")
+        client.schema.delete_class(CLASS_NAME)
+
+
+if __name__ == "__main__":
+    main()
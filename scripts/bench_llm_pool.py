@@ -0,0 +1,100 @@
+"""Compare a new ChatOpenAI per request against the pooled per-key clients, on a fake OpenAI server.
+
+The fake server answers /v1/chat/completions with a fixed completion after --delay-ms and
+counts the TCP connections it accepts, so the run shows both latency and connection reuse.
+
+Usage:
+    python -m scripts.bench_llm_pool [--requests 500] [--concurrency 50] [--keys 20] [--delay-ms 50]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+from langchain_openai import ChatOpenAI
+
+from app.helpers.llm_pool import LLMPool
+
+COMPLETION = json.dumps({
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-3.5-turbo",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "A benchmark answer."}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 4, "total_tokens": 14}
+}).encode()
+
+
+class FakeOpenAI(object):
+    def __init__(self, delay):
+        self.delay = delay
+        self.connections = 0
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                await reader.readexactly(length)
+                await asyncio.sleep(self.delay)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: keep-alive\r\n"
+                    + f"Content-Length: {len(COMPLETION)}\r\n\r\n".encode() + COMPLETION
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run(get_client, requests, concurrency, keys):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(index):
+        async with semaphore:
+            start = time.perf_counter()
+            await get_client(f"sk-bench-{index % keys}").ainvoke([{"role": "user", "content": "ping"}])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies = np.asarray(latencies) * 1000
+    return requests / elapsed, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type = int, default = 500)
+    parser.add_argument("--concurrency", type = int, default = 50)
+    parser.add_argument("--keys", type = int, default = 20)
+    parser.add_argument("--delay-ms", type = float, default = 50)
+    args = parser.parse_args()
+
+    fake = FakeOpenAI(args.delay_ms / 1000)
+    server = await asyncio.start_server(fake.handle, "127.0.0.1", 0)
+    base_url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/v1"
+
+    def fresh(key):
+        return ChatOpenAI(api_key = key, model = "gpt-3.5-turbo", temperature = 0, base_url = base_url)
+
+    pool = LLMPool(max_clients = args.keys, base_url = base_url)
+    for name, get_client in (("new client per call", fresh), ("pooled per key", pool.get)):
+        fake.connections = 0
+        rate, p50, p95 = await run(get_client, args.requests, args.concurrency, args.keys)
+        print(f"{name:<20} {rate:>8.1f} req/s  p50 {p50:>7.1f}ms  p95 {p95:>7.1f}ms  {fake.connections} connections")
+    print(f"Pool: {pool.stats()}")
+    await pool.aclose()
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""Parity check and throughput benchmark of the ONNX embedding backend against PyTorch.
+
+Usage:
+    python -m scripts.bench_onnx [path/to/paper.pdf] [--quantize] [--threads 4] [--batch-size 32]
+
+Without a PDF a fixed set of sample sentences is used.
+"""
+import argparse
+import time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from app.core.config import settings
+from app.helpers.onnx_embedder import OnnxEmbedder
+
+SAMPLE_TEXTS = [
+    "Transformers replace recurrence with self-attention over the whole sequence.",
+    "We evaluate on ImageNet and report top-1 accuracy for every model size.",
+    "The BRCA1 gene is associated with an increased risk of breast cancer.",
+    "Equation 3 defines the contrastive loss used during pre-training.",
+    "Results in Table 2 show that dropout reduces overfitting on small datasets.",
+    "query: what optimizer was used to train the model?",
+]
+
+
+def throughput(model, texts, batch_size):
+    start = time.time()
+    vectors = model.encode(texts, batch_size = batch_size, normalize_embeddings = True, show_progress_bar = False)
+    elapsed = time.time() - start
+    return np.asarray(vectors), len(texts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf", nargs = "?")
+    parser.add_argument("--quantize", action = "store_true")
+    parser.add_argument("--threads", type = int, default = settings.ONNX_THREADS)
+    parser.add_argument("--batch-size", type = int, default = 32)
+    args = parser.parse_args()
+
+    if args.pdf:
+        from app.helpers.weaviate import PDFLoader
+        texts = [chunk["text"] for chunk in PDFLoader().load(args.pdf, "benchmark", [], args.pdf)]
+    else:
+        texts = SAMPLE_TEXTS * 50
+    print(f"{len(texts)} texts")
+
+    torch_model = SentenceTransformer(settings.EMBEDDING_MODEL)
+    onnx_model = OnnxEmbedder(
+        settings.EMBEDDING_MODEL,
+        settings.ONNX_MODEL_DIR,
+        quantize = args.quantize,
+        threads = args.threads,
+        max_length = settings.EMBED_MAX_LENGTH
+    )
+
+    # Warm up both so one-time graph setup is not counted
+    torch_model.encode(texts[:4])
+    onnx_model.encode(texts[:4])
+
+    torch_vectors, torch_rate = throughput(torch_model, texts, args.batch_size)
+    onnx_vectors, onnx_rate = throughput(onnx_model, texts, args.batch_size)
+
+    cosine = (torch_vectors * onnx_vectors).sum(axis = 1)
+    print(f"Cosine agreement: mean {cosine.mean():.5f}, min {cosine.min():.5f}")
+    print(f"PyTorch: {torch_rate:.1f} texts/sec")
+    print(f"ONNX{' int8' if args.quantize else ''}: {onnx_rate:.1f} texts/sec ({onnx_rate / torch_rate:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
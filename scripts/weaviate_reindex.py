@@ -0,0 +1,74 @@
+"""Rebuild the Weaviate Document class with the vector index settings from Settings.
+
+efConstruction, maxConnections and BQ compression cannot be changed on a live class. This
+exports every object with its vector to a JSONL file, drops the class, recreates it through
+ensure_schema and imports the objects back. The export is kept, so a failed import can be
+resumed with --import-only.
+
+Usage:
+    python -m scripts.weaviate_reindex [--export backup.jsonl] [--export-only | --import-only] [--batch-size 500]
+"""
+import argparse
+import json
+
+from app.core.config import settings
+from app.helpers.weaviate import WeaviateDB
+
+
+def export_objects(client, path, batch_size):
+    properties = [prop["name"] for prop in client.schema.get("Document").get("properties", [])]
+    cursor = None
+    count = 0
+    with open(path, "w") as f:
+        while True:
+            query = client.query.get("Document", properties).with_additional(["id", "vector"]).with_limit(batch_size)
+            if cursor is not None:
+                query = query.with_after(cursor)
+            objects = query.do()["data"]["Get"]["Document"]
+            if not objects:
+                break
+            for obj in objects:
+                additional = obj.pop("_additional")
+                f.write(json.dumps({"id": additional["id"], "vector": additional["vector"], "properties": obj}) + "\n")
+                cursor = additional["id"]
+            count += len(objects)
+            print(f"Exported {count} objects")
+    return count
+
+
+def import_objects(client, path, batch_size):
+    count = 0
+    client.batch.configure(batch_size = batch_size)
+    with client.batch as batch, open(path) as f:
+        for line in f:
+            obj = json.loads(line)
+            properties = {name: value for name, value in obj["properties"].items() if value is not None}
+            batch.add_data_object(data_object = properties, class_name = "Document", uuid = obj["id"], vector = obj["vector"])
+            count += 1
+    print(f"Imported {count} objects")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--export", default = "document_export.jsonl")
+    parser.add_argument("--export-only", action = "store_true")
+    parser.add_argument("--import-only", action = "store_true")
+    parser.add_argument("--batch-size", type = int, default = 500)
+    args = parser.parse_args()
+
+    vectordb = WeaviateDB(settings.WEAVIATE_URL)
+    client = vectordb.client
+    if not args.import_only:
+        exported = export_objects(client, args.export, args.batch_size)
+        print(f"Exported {exported} objects to {args.export}")
+        if args.export_only:
+            return
+        client.schema.delete_class("Document")
+    vectordb.ensure_schema()
+    import_objects(client, args.export, args.batch_size)
+    print(f"Document index config: {client.schema.get('Document').get('vectorIndexConfig')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,4 @@
+import os
+
+# Settings() requires a database URL; the tests never connect to it
+os.environ.setdefault("DATABASE_URL", "sqlite://")
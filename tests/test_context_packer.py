@@ -0,0 +1,38 @@
+import types
+
+import pytest
+
+pytest.importorskip("tiktoken")
+
+from app.helpers.context_packer import ContextPacker
+
+
+def packer(budget):
+    packer = ContextPacker(budget)
+    # One token per whitespace-separated word keeps the budgets in these tests exact
+    packer._encoding = types.SimpleNamespace(encode = lambda text: text.split())
+    return packer
+
+
+def hit(title, text):
+    return {"title": title, "source": f"{title}.pdf", "authors": ["Ada"], "text": text}
+
+
+def test_budget_is_spent_in_rank_order_across_papers():
+    hits = [
+        hit("P1", "First low passage of paper one."),
+        hit("P2", "High ranked passage of paper two."),
+        hit("P1", "Second low passage of paper one."),
+    ]
+    for budget in range(24, 45):
+        context = packer(budget).pack(hits)
+        if "Second low passage" in context:
+            assert "High ranked passage" in context
+
+
+def test_overlapping_windows_are_stitched_once():
+    hits = [hit("P1", "A one. B two. C three."), hit("P1", "B two. C three. D four.")]
+    context = packer(100).pack(hits)
+    assert context.count("B two.") == 1
+    assert "A one. B two. C three. D four." in context
+    assert context.count("Title of Paper: P1") == 1
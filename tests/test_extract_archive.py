@@ -0,0 +1,51 @@
+import os
+import zipfile
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.helpers.ingest import extract_archive
+
+
+def archive(tmp_path, members):
+    path = str(tmp_path / "archive.zip")
+    with zipfile.ZipFile(path, "w") as f:
+        for name, content in members.items():
+            f.writestr(name, content)
+    return path
+
+
+def test_pdfs_are_extracted_under_the_target(tmp_path):
+    path = archive(tmp_path, {"a.pdf": b"%PDF-a", "nested/b.PDF": b"%PDF-b", "notes.txt": b"skip"})
+    target = tmp_path / "out"
+    extracted = extract_archive(path, str(target))
+    assert sorted(extracted) == ["a.pdf", "nested/b.PDF"]
+    with open(extracted["nested/b.PDF"], "rb") as f:
+        assert f.read() == b"%PDF-b"
+    assert not os.path.exists(target / "notes.txt")
+
+
+@pytest.mark.parametrize("name", ["../escape.pdf", "nested/../../escape.pdf", "/abs/escape.pdf"])
+def test_paths_escaping_the_target_are_rejected(tmp_path, name):
+    path = archive(tmp_path, {name: b"%PDF"})
+    target = tmp_path / "out" / "inner"
+    with pytest.raises(ValueError, match = "Unsafe path"):
+        extract_archive(path, str(target))
+    assert not os.path.exists(tmp_path / "out" / "escape.pdf")
+    assert not os.path.exists(tmp_path / "escape.pdf")
+
+
+def test_file_count_limit(tmp_path):
+    path = archive(tmp_path, {f"{index}.pdf": b"%PDF" for index in range(3)})
+    with pytest.raises(ValueError, match = "Too many PDFs"):
+        extract_archive(path, str(tmp_path / "out"), max_files = 2)
+    assert len(extract_archive(path, str(tmp_path / "out"), max_files = 3)) == 3
+
+
+def test_uncompressed_size_limit(tmp_path):
+    # Compresses to almost nothing but expands past the limit
+    path = archive(tmp_path, {"big.pdf": b"\0" * 4096})
+    with pytest.raises(ValueError, match = "limit"):
+        extract_archive(path, str(tmp_path / "out"), max_bytes = 4095)
+    assert not os.path.exists(tmp_path / "out" / "big.pdf")
@@ -0,0 +1,71 @@
+import threading
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+from app.helpers.ingest import IngestPipeline
+
+
+class RecordingStore(object):
+    def __init__(self, fail_on_write = None):
+        self.written = []
+        self.fail_on_write = fail_on_write
+
+    def write_chunks(self, chunks, vectors):
+        if len(self.written) == self.fail_on_write:
+            raise RuntimeError("write failed")
+        self.written.append([chunk["text"] for chunk in chunks])
+
+
+def pipeline(store, fail_on_embed = None):
+    pipeline = IngestPipeline(store, batch_size = 2, queue_size = 1)
+    calls = []
+
+    def embed(texts):
+        if len(calls) == fail_on_embed:
+            raise RuntimeError("embed failed")
+        calls.append(texts)
+        return [[1.0, 0.0] for _ in texts]
+    # Stands in for the embedding model, which the tests never load
+    pipeline.embed = embed
+    return pipeline
+
+
+def pages(count, fail_at = None):
+    for page in range(count):
+        if page == fail_at:
+            raise RuntimeError("parse failed")
+        yield [{"text": f"p{page}c{index}"} for index in range(3)]
+
+
+def run_to_error(pipeline, pages):
+    before = threading.active_count()
+    with pytest.raises(RuntimeError) as error:
+        pipeline.run(pages)
+    # The parse and embed threads are joined, not left blocked on a full queue
+    assert threading.active_count() == before
+    return str(error.value)
+
+
+def test_all_chunks_are_written_in_batches():
+    store = RecordingStore()
+    stats = pipeline(store).run(pages(5))
+    assert stats["chunks"] == 15
+    assert stats["parse"]["items"] == 5
+    assert all(len(batch) <= 2 for batch in store.written)
+    assert [text for batch in store.written for text in batch] == [f"p{page}c{index}" for page in range(5) for index in range(3)]
+
+
+def test_parse_error_propagates():
+    assert run_to_error(pipeline(RecordingStore()), pages(50, fail_at = 3)) == "parse failed"
+
+
+def test_embed_error_propagates():
+    assert run_to_error(pipeline(RecordingStore(), fail_on_embed = 2), pages(50)) == "embed failed"
+
+
+def test_write_error_propagates():
+    store = RecordingStore(fail_on_write = 1)
+    assert run_to_error(pipeline(store), pages(50)) == "write failed"
+    assert len(store.written) == 1
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pydantic_settings")
+
+from app.helpers.numpy_store import NumpyVectorStore
+
+
+def chunk(title, text, page = 1):
+    return {"text": text, "paper-name": title, "authors": ["Ada"], "metadata": {"source": f"{title}.pdf", "page": page}}
+
+
+def titles(store):
+    return [row["title"] for row in store.snapshot()[1]]
+
+
+def test_crash_between_appends_is_repaired_on_open(tmp_path):
+    store = NumpyVectorStore(str(tmp_path))
+    store.write_chunks([chunk("A", "alpha"), chunk("B", "beta")], np.eye(2, 4))
+    # A crash mid write_chunks: the vector is synced, its row only partly written
+    with open(store._vectors_path, "ab") as f:
+        f.write(np.ones(4, dtype = np.float32).tobytes())
+    with open(store._rows_path, "a") as f:
+        f.write('{"title": "C", "te')
+
+    reopened = NumpyVectorStore(str(tmp_path))
+    assert titles(reopened) == ["A", "B"]
+    assert os.path.getsize(reopened._vectors_path) == 2 * 4 * 4
+
+    # The next append lines up with its row instead of landing after the stale tail
+    reopened.write_chunks([chunk("D", "delta")], np.eye(1, 4, 3))
+    hits = NumpyVectorStore(str(tmp_path)).vector_search(np.eye(1, 4, 3)[0], 1)
+    assert hits[0]["title"] == "D"
+
+
+def test_crash_before_delete_commits_keeps_the_old_generation(tmp_path):
+    store = NumpyVectorStore(str(tmp_path))
+    store.write_chunks([chunk("A", "alpha"), chunk("B", "beta")], np.eye(2, 4))
+    # Next-generation files written, but meta.json never swapped to name them
+    vectors_path, rows_path = store._generation_paths(store.generation + 1)
+    with open(vectors_path, "wb") as f:
+        f.write(np.eye(1, 4, 1, dtype = np.float32).tobytes())
+    with open(rows_path, "w") as f:
+        f.write('{"title": "B", "text": "beta"}\n')
+
+    reopened = NumpyVectorStore(str(tmp_path))
+    assert titles(reopened) == ["A", "B"]
+    assert not os.path.exists(vectors_path) and not os.path.exists(rows_path)
+
+
+def test_reload_after_another_process_writes_and_deletes(tmp_path):
+    api = NumpyVectorStore(str(tmp_path))
+    worker = NumpyVectorStore(str(tmp_path))
+    version = api.corpus_version
+
+    worker.write_chunks([chunk("A", "alpha gene"), chunk("B", "beta gene")], np.eye(2, 4))
+    assert api.corpus_version > version
+    assert titles(api) == ["A", "B"]
+    assert [hit["title"] for hit in api.keyword_search("beta", 5)] == ["B"]
+
+    version = api.corpus_version
+    assert worker.delete("A")["success"]
+    assert api.corpus_version > version
+    assert titles(api) == ["B"]
+    assert api.vector_search(np.eye(1, 4, 1)[0], 1)[0]["title"] == "B"
+
+    # Appends from this process continue after the other process's rows
+    api.write_chunks([chunk("C", "gamma")], np.eye(1, 4, 2))
+    assert titles(worker) == ["B", "C"]